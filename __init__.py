@@ -1,13 +1,24 @@
 from bl_operators.presets import AddPresetBase
 import subprocess
+import array
 import platform
 import os
 import re
+import sys
+import json
+import functools
+import collections
 from collections import namedtuple
 import time
-import mathutils
-import math
+import numpy as np
 import bpy
+import bpy.utils.previews
+
+from . import color_math
+from . import profiling
+from . import preset_xml
+from . import theme_diff
+from . import cube_lut
 
 bl_info = {
     'name': 'Theme Editor',
@@ -24,21 +35,159 @@ bl_info = {
 }
 
 
-ColorTuple = namedtuple('ColorTuple', ['struct', 'key', 'path'])
+class ThemeProperties:
+    """Every theme color property, stored by column and referred to by its index.
+    The display paths ("3D Viewport::Theme Space::Back") are a trie of interned segments,
+    so the properties of a struct share their path prefix"""
+    __slots__ = ('structs', 'struct_paths', 'struct_ids', 'keys', 'sizes', 'nodes',
+                 'node_parents', 'node_names', 'node_lookup')
+
+    def __init__(self):
+        self.structs = []
+        self.struct_paths = []
+        self.struct_ids = array.array('i')
+        self.keys = []
+        self.sizes = array.array('b')
+        # the path trie node of each property, node 0 is the root with an empty path
+        self.nodes = array.array('i')
+        self.node_parents = array.array('i', [-1])
+        self.node_names = [""]
+        self.node_lookup = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_struct(self, struct, struct_path):
+        self.structs.append(struct)
+        self.struct_paths.append(struct_path)
+        return len(self.structs) - 1
+
+    def path_node(self, parent, name):
+        if parent == 0 and name == "":
+            return 0
+        node = self.node_lookup.get((parent, name))
+        if node is None:
+            node = self.node_lookup[(parent, name)] = len(self.node_names)
+            self.node_parents.append(parent)
+            self.node_names.append(sys.intern(name))
+        return node
+
+    def add(self, struct_id, key, node, size):
+        self.struct_ids.append(struct_id)
+        self.keys.append(sys.intern(key))
+        self.nodes.append(node)
+        self.sizes.append(size)
+        return len(self.keys) - 1
+
+    def struct(self, index):
+        return self.structs[self.struct_ids[index]]
+
+    def get(self, index):
+        return getattr(self.structs[self.struct_ids[index]], self.keys[index])
+
+    def set(self, index, color):
+        setattr(self.structs[self.struct_ids[index]], self.keys[index],
+                color[0:self.sizes[index]])
+
+    def segments(self, index):
+        segments = []
+        node = self.nodes[index]
+        while node > 0:
+            segments.append(self.node_names[node])
+            node = self.node_parents[node]
+        segments.reverse()
+        return segments
+
+    def path(self, index):
+        return "::".join(self.segments(index))
+
+    def data_path(self, index):
+        """The property path from the theme root, like the preset colors paths"""
+        struct_path = self.struct_paths[self.struct_ids[index]]
+        key = self.keys[index]
+        return struct_path + "." + key if struct_path else key
+
+    def data_paths(self):
+        return [self.data_path(index) for index in range(len(self.keys))]
+
+    def size_array(self):
+        return np.frombuffer(self.sizes, dtype=np.int8)
+
+
 theme_properties = None
 colors = None
 ordered_colors = None
 already_built = False
 
-UndoItem = namedtuple('UndoItem', ['color', 'struct', 'key'])
+# Packed N x 4 RGBA and N x 3 HSV colors of every theme property, indexed like theme_properties
+theme_rgba = None
+theme_hsv = None
+
+# Cached outputs of the build_color_list stages,
+# color_list_stage is the first stage that has to run again on the next build
+STAGE_READ = 0
+STAGE_GROUP = 1
+STAGE_FILTER = 2
+STAGE_SORT = 3
+STAGE_DONE = 4
+color_list_stage = STAGE_READ
+
+# Every property grouped by color, labels is the group of each property.
+# The color_groups collection holds every group, the filters and sorting
+# are applied by the UI list from filter_mask, group_visible and group_order.
+ThemeGroups = namedtuple('ThemeGroups', ['colors', 'keys', 'members', 'labels'])
+theme_groups = None
+published_groups = None
+ungrouped_properties = set()
+filter_mask = None
+filtered_members = None
+filtered_groups = None
+sorted_groups = None
+group_visible = None
+group_order = None
+
+# Each undo step only stores the properties that changed, as (index, before, after) items,
+# UndoState holds a copy of theme_rgba at the current undo level to diff new steps against.
+UndoItem = namedtuple('UndoItem', ['index', 'before', 'after'])
 UndoSteps = []
 UndoLevel = 0
+UndoState = None
+UndoDirty = set()
+UndoMemory = 0
 CanPushUndo = True
 
+UNDO_ITEM_SIZE = (sys.getsizeof(UndoItem(0, (0.0,) * 4, (0.0,) * 4)) +
+                  2 * (sys.getsizeof((0.0,) * 4) + 4 * sys.getsizeof(0.0)))
+
+
+def get_preferences():
+    addon = bpy.context.preferences.addons.get(__name__)
+    if addon:
+        return addon.preferences
+    return None
+
+
+def undo_step_size(undo_step):
+    return sys.getsizeof(undo_step) + len(undo_step) * UNDO_ITEM_SIZE
+
+
+def trim_undo_steps():
+    global UndoMemory
+    preferences = get_preferences()
+    undo_memory = preferences.undo_memory if preferences else 32
+    limit = undo_memory * 1024 * 1024
+    # always keep the latest step, even if it doesn't fit by itself
+    while UndoMemory > limit and len(UndoSteps) > 1:
+        UndoMemory -= undo_step_size(UndoSteps.pop(0))
 
-def push_undo_step():
+
+@profiling.profiled("push_undo_step")
+def push_undo_step(full=False):
+    """Store the colors changed since the last step, read from the theme_rgba table.
+    Only the properties written through write_colors are checked, unless full is True
+    (the theme was modified from outside the addon and read again, for example after loading a preset)"""
     global CanPushUndo
-    if CanPushUndo == False:
+    if CanPushUndo == False or theme_rgba is None:
         return
 
     theme_edit = bpy.context.window_manager.theme_edit
@@ -46,30 +195,63 @@ def push_undo_step():
     theme_edit.highlight_selected = False
 
     global UndoLevel
+    global UndoMemory
+    global UndoState
     for i in range(0, UndoLevel):
-        UndoSteps.pop()
+        UndoMemory -= undo_step_size(UndoSteps.pop())
     UndoLevel = 0
-    undo_step = []
-    for prop in theme_properties:
-        attribute = getattr(prop.struct, prop.key)
-        color = color_to_tuple(attribute)
-        undo_step.append(UndoItem(color, prop.struct, prop.key))
-    UndoSteps.append(undo_step)
+
+    if UndoState is None:
+        UndoState = theme_rgba.copy()
+        changed = []
+    elif full:
+        changed = np.flatnonzero(np.any(theme_rgba != UndoState, axis=1))
+    else:
+        changed = [i for i in UndoDirty
+                   if not np.array_equal(theme_rgba[i], UndoState[i])]
+    UndoDirty.clear()
+
+    undo_step = [UndoItem(i, tuple(UndoState[i].tolist()), tuple(theme_rgba[i].tolist()))
+                 for i in changed]
+    UndoState[changed] = theme_rgba[changed]
+
+    if undo_step:
+        UndoSteps.append(undo_step)
+        UndoMemory += undo_step_size(undo_step)
+        trim_undo_steps()
     theme_edit.highlight_selected = highlight
 
 
-def apply_undo_step(undo_step):
+@profiling.profiled("apply_undo_step")
+def apply_undo_step(undo_step, redo=False):
     theme_edit = bpy.context.window_manager.theme_edit
     highlight = theme_edit.highlight_selected
     theme_edit.highlight_selected = False
 
+    write_colors((undo_item.index, undo_item.after if redo else undo_item.before)
+                 for undo_item in undo_step)
     for undo_item in undo_step:
-        set_color(undo_item, undo_item.color)
+        UndoState[undo_item.index] = undo_item.after if redo else undo_item.before
 
-    build_color_list()
+    build_color_list(STAGE_GROUP)
     theme_edit.highlight_selected = highlight
 
 
+def undo_level_colors(level):
+    """The theme_rgba table at an undo level, the number of steps undone from the latest one"""
+    rgba = (theme_rgba if UndoState is None else UndoState).copy()
+    level = min(max(level, 0), len(UndoSteps))
+    if level > UndoLevel:
+        steps = reversed(UndoSteps[len(UndoSteps) - level:len(UndoSteps) - UndoLevel])
+    else:
+        steps = UndoSteps[len(UndoSteps) - UndoLevel:len(UndoSteps) - level]
+    for undo_step in steps:
+        indices = [undo_item.index for undo_item in undo_step]
+        rgba[indices] = [undo_item.before if level > UndoLevel else undo_item.after
+                         for undo_item in undo_step]
+    return rgba
+
+
 class WM_OT_theme_editor_undo(bpy.types.Operator):
     bl_idname = "wm.theme_editor_undo"
     bl_label = "Theme Editor Undo"
@@ -77,12 +259,12 @@ class WM_OT_theme_editor_undo(bpy.types.Operator):
 
     @classmethod
     def poll(cls, context):
-        return len(UndoSteps) > 1 and len(UndoSteps) > UndoLevel + 1
+        return len(UndoSteps) > UndoLevel
 
     def execute(self, context):
         global UndoLevel
-        UndoLevel += 1
         index = len(UndoSteps) - 1 - UndoLevel
+        UndoLevel += 1
         apply_undo_step(UndoSteps[index])
         return {'FINISHED'}
 
@@ -100,7 +282,7 @@ class WM_OT_theme_editor_redo(bpy.types.Operator):
         global UndoLevel
         UndoLevel -= 1
         index = len(UndoSteps) - 1 - UndoLevel
-        apply_undo_step(UndoSteps[index])
+        apply_undo_step(UndoSteps[index], redo=True)
         return {'FINISHED'}
 
 
@@ -115,6 +297,17 @@ def color_to_tuple(color):
         return tuple(color)
 
 
+def get_group_colors(color_groups):
+    group_colors = np.empty(len(color_groups) * 4, dtype=np.float32)
+    color_groups.foreach_get("color", group_colors)
+    return group_colors.reshape(-1, 4)
+
+
+def property_name(index):
+    """The property key and path, without the root struct name"""
+    return (theme_properties.keys[index], tuple(theme_properties.segments(index)[1:]))
+
+
 def set_collection_length(collection, length):
     while len(collection) < length:
         collection.add()
@@ -122,55 +315,469 @@ def set_collection_length(collection, length):
         collection.remove(len(collection) - 1)
 
 
+def group_properties(index):
+    """Every property of a color group, including the ones hidden by the filters"""
+    return theme_groups.members[index]
+
+
 def update_path_collection_length():
     theme_edit = bpy.context.window_manager.theme_edit
     index = theme_edit.group_index
     length = 0
     if index < len(ordered_colors):
-        length = len(color_paths(index))
+        length = len(theme_groups.members[index])
     set_collection_length(theme_edit.color_paths, length)
 
 
-def sort_paths(search_terms):
-    for color, params in colors.items():
-        params.sort(key=lambda e: (filter_string(
-            e.path, search_terms) == False, e.path))
-
-
-def filter_string(string, filter):
-    match = False
-    string = string.lower()
-    filter = filter.lower()
-    filters = filter.split(',')
-    for filter in filters:
-        filter = filter.strip()
-        if filter.startswith('?'):
-            if filter.strip('? ') in string:
-                match = True
-        elif filter.startswith('-'):
-            if filter.strip('- ') in string:
-                match = False
-                break
+# The properties loaded in theme_edit.color_paths, in theme order
+path_list = []
+# Path list new order by (group index, sort_terms), cleared on regroup
+path_order_cache = {}
+
+
+def get_path_order(index, sort_terms):
+    """The path list new order of a color group, with the paths that match sort_terms first"""
+    order = path_order_cache.get((index, sort_terms))
+    if order is None:
+        properties = group_properties(index).tolist()
+        name_filter = compile_name_filter(sort_terms)
+        lower_paths = get_path_index().paths
+        ranks = sorted(range(len(properties)), key=lambda i: (
+            match_name_filter(name_filter, lower_paths[properties[i]]) == False,
+            theme_properties.path(properties[i])))
+        order = [0] * len(ranks)
+        for new, old in enumerate(ranks):
+            order[old] = new
+        if len(path_order_cache) > 256:
+            path_order_cache.clear()
+        path_order_cache[(index, sort_terms)] = order
+    return order
+
+
+NameFilter = namedtuple('NameFilter', ['required', 'optional', 'excluded'])
+
+
+@functools.lru_cache(maxsize=64)
+def compile_name_filter(filter):
+    """Parse a comma separated name filter into its required, optional (?) and excluded (-) terms"""
+    required = []
+    optional = []
+    excluded = []
+    for term in filter.lower().split(','):
+        term = term.strip()
+        if term.startswith('?'):
+            optional.append(term.strip('? '))
+        elif term.startswith('-'):
+            excluded.append(term.strip('- '))
+        else:
+            required.append(term)
+    return NameFilter(tuple(required), tuple(optional), tuple(excluded))
+
+
+def match_name_filter(name_filter, string):
+    if any(term not in string for term in name_filter.required):
+        return False
+    if any(term in string for term in name_filter.excluded):
+        return False
+    return len(name_filter.required) > 0 or any(term in string for term in name_filter.optional)
+
+
+# Lowercase paths of theme_properties, and the properties that contain each unique path segment
+PathIndex = namedtuple('PathIndex', ['paths', 'segments', 'segment_properties'])
+path_index = None
+term_masks = {}
+
+
+def get_path_index():
+    global path_index
+    if path_index is None or len(path_index.paths) != len(theme_properties):
+        paths = [theme_properties.path(index).lower() for index in range(len(theme_properties))]
+        segments = {}
+        for index, path in enumerate(paths):
+            for segment in set(path.split('::')):
+                segments.setdefault(segment, []).append(index)
+        path_index = PathIndex(paths, list(segments.keys()),
+                               [np.array(properties) for properties in segments.values()])
+        term_masks.clear()
+    return path_index
+
+
+def get_term_mask(term):
+    """Mask of the properties whose path contains term"""
+    mask = term_masks.get(term)
+    if mask is None:
+        index = get_path_index()
+        if ':' in term:
+            # the term can span several segments
+            mask = np.fromiter((term in path for path in index.paths),
+                               dtype=bool, count=len(index.paths))
         else:
-            if filter in string:
-                match = True
+            mask = np.zeros(len(index.paths), dtype=bool)
+            for segment, properties in zip(index.segments, index.segment_properties):
+                if term in segment:
+                    mask[properties] = True
+        if len(term_masks) > 256:
+            term_masks.clear()
+        term_masks[term] = mask
+    return mask
+
+
+def get_name_filter_mask(filter):
+    """Vectorized match_name_filter of the compiled filter over the paths of every theme property"""
+    name_filter = compile_name_filter(filter)
+    mask = np.ones(len(theme_properties), dtype=bool)
+    for term in name_filter.required:
+        mask &= get_term_mask(term)
+    for term in name_filter.excluded:
+        mask &= ~get_term_mask(term)
+    if len(name_filter.required) == 0:
+        optional = np.zeros(len(theme_properties), dtype=bool)
+        for term in name_filter.optional:
+            optional |= get_term_mask(term)
+        mask &= optional
+    return mask
+
+
+def walk_theme(theme, properties):
+    """Collect the theme color properties, yields after each struct so the walk can be time sliced"""
+    def inspect_struct(struct, node=0, struct_path=""):
+        struct_id = None
+        for key in dir(struct):
+            if key in ["bl_rna", "rna_type"]:
+                continue
+            attribute = getattr(struct, key)
+            name = ""
+            if key in struct.bl_rna.properties:
+                name = struct.bl_rna.properties[key].name
+            if issubclass(type(attribute), bpy.types.bpy_struct):
+                yield from inspect_struct(attribute, properties.path_node(node, name),
+                                          struct_path+"."+key if struct_path else key)
             else:
-                match = False
-                break
-    return match
+                color = color_to_tuple(attribute)
+                if color:
+                    if struct_id is None:
+                        struct_id = properties.add_struct(struct, struct_path)
+                    properties.add(struct_id, key, properties.path_node(node, name), len(attribute))
+        yield
+
+    yield from inspect_struct(theme)
+
+
+def inspect_theme(theme):
+    properties = ThemeProperties()
+    for step in walk_theme(theme, properties):
+        pass
+    return properties
+
+
+def theme_cache_path():
+    path = bpy.utils.user_resource(
+        'DATAFILES', path="theme_editor", create=True)
+    return os.path.join(path, "theme_properties.json")
+
+
+THEME_CACHE_FORMAT = 2
+
+
+def theme_cache_key():
+    return {"blender": list(bpy.app.version), "addon": list(bl_info['version']),
+            "format": THEME_CACHE_FORMAT}
+
+
+def read_theme_cache(theme):
+    """Rebuild the theme properties from the cached introspection,
+    returns None if there's no valid cache for this Blender and addon version"""
+    try:
+        with open(theme_cache_path()) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cache.get("key") != theme_cache_key():
+        return None
+
+    properties = ThemeProperties()
+    try:
+        for struct_path in cache["structs"]:
+            struct = theme
+            for name in struct_path.split('.') if struct_path else ():
+                struct = getattr(struct, name)
+            properties.add_struct(struct, struct_path)
+        for parent, name in cache["nodes"]:
+            properties.path_node(parent, name)
+        for struct_id, key, node, size in cache["properties"]:
+            properties.add(struct_id, key, node, size)
+    except (AttributeError, KeyError, TypeError, ValueError, OverflowError):
+        return None
+    return properties
+
+
+def write_theme_cache(properties):
+    cache = {
+        "key": theme_cache_key(),
+        "structs": properties.struct_paths,
+        "nodes": list(zip(properties.node_parents[1:], properties.node_names[1:])),
+        "properties": list(zip(properties.struct_ids, properties.keys,
+                               properties.nodes, properties.sizes))
+    }
+    try:
+        with open(theme_cache_path(), 'w') as file:
+            json.dump(cache, file)
+    except OSError:
+        pass
+
+
+def read_theme_colors_steps(rgba, chunk_size=256):
+    """Read the theme colors into rgba, yields the progress after each chunk of properties"""
+    properties = theme_properties
+    for start in range(0, len(properties), chunk_size):
+        for index in range(start, min(start + chunk_size, len(properties))):
+            rgba[index, 0:properties.sizes[index]] = properties.get(index)
+        yield min(start + chunk_size, len(properties)) / len(properties)
+
+
+def read_theme_rows(indices):
+    """The current theme colors of the properties at indices, as rows of a theme_rgba like table"""
+    properties = theme_properties
+    rgba = np.ones((len(indices), 4), dtype=np.float32)
+    for row, index in enumerate(indices.tolist()):
+        rgba[row, 0:properties.sizes[index]] = properties.get(index)
+    return rgba
+
+
+def set_theme_colors(rgba):
+    global theme_rgba
+    global theme_hsv
+    global color_list_stage
+    theme_rgba = rgba
+    theme_hsv = color_math.rgb_to_hsv(rgba[:, 0:3])
+    color_list_stage = STAGE_GROUP
+
+
+def read_theme_colors():
+    """Read every theme color into the packed theme_rgba / theme_hsv tables"""
+    rgba = np.ones((len(theme_properties), 4), dtype=np.float32)
+    for progress in read_theme_colors_steps(rgba, max(len(theme_properties), 1)):
+        pass
+    set_theme_colors(rgba)
+
+
+def group_color_table(rgba):
+    """Group the rows with matching colors, keeping the table order inside each group"""
+    group_colors, inverse, counts = np.unique(
+        rgba, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    members = np.split(np.argsort(inverse, kind='stable'),
+                       np.cumsum(counts)[:-1])
+    keys = [tuple(color) for color in group_colors.tolist()]
+    return ThemeGroups(group_colors, keys, members, inverse)
+
+
+# Preset colors are read from the preset_xml index, saved next to the theme cache
+preset_index = None
+theme_path_lookup = None
+
+
+def preset_index_path():
+    path = bpy.utils.user_resource(
+        'DATAFILES', path="theme_editor", create=True)
+    return os.path.join(path, "preset_index.json")
+
+
+def get_preset_colors(filepaths=None):
+    """The colors of the given preset files, or of every interface theme preset,
+    as {filepath: PresetColors}. Only the files modified since the last call are parsed"""
+    global preset_index
+    if preset_index is None:
+        preset_index = preset_xml.load_preset_index(preset_index_path())
+    if filepaths is None:
+        filepaths = preset_xml.find_presets(bpy.utils.preset_paths("interface_theme"))
+    presets, changed = preset_xml.update_preset_index(preset_index, filepaths)
+    if changed:
+        preset_xml.save_preset_index(preset_index, preset_index_path())
+    return presets
+
+
+def preset_table(preset_colors):
+    """The preset colors as rows of a theme_rgba like table, and the mask of the rows
+    the preset has a color for"""
+    global theme_path_lookup
+    if theme_path_lookup is None or theme_path_lookup[0] is not theme_properties:
+        theme_path_lookup = (theme_properties, {
+            path: index for index, path in enumerate(theme_properties.data_paths())})
+    lookup = theme_path_lookup[1]
+    rgba = np.ones((len(theme_properties), 4), dtype=np.float32)
+    found = np.zeros(len(theme_properties), dtype=bool)
+    rows = [(row, lookup[path]) for row, path in enumerate(preset_colors.paths) if path in lookup]
+    if rows:
+        rows, indices = np.array(rows, dtype=int).T
+        rgba[indices] = preset_colors.rgba[rows]
+        rgba[indices[preset_colors.sizes[rows] == 3], 3] = 1.0
+        found[indices] = True
+    return rgba, found
+
+
+def group_theme_colors():
+    global theme_groups
+    theme_groups = group_color_table(theme_rgba)
+    ungrouped_properties.clear()
+    path_order_cache.clear()
+
+
+def update_grouped_colors(indices):
+    """Track the properties that no longer match the color of their group"""
+    if theme_groups is None or len(indices) == 0:
+        return
+    group_colors = theme_groups.colors[theme_groups.labels[indices]]
+    grouped = np.all(theme_rgba[indices] == group_colors, axis=1)
+    ungrouped_properties.difference_update(indices[grouped].tolist())
+    ungrouped_properties.update(indices[~grouped].tolist())
+
+
+def patch_theme_groups(changed):
+    """Move the changed properties to the group matching their new color.
+    New colors are added as groups at the end, so the published groups keep their indices"""
+    global theme_groups
+    keys = list(theme_groups.keys)
+    group_lookup = {key: group for group, key in enumerate(keys)}
+    labels = theme_groups.labels.copy()
+    affected = set(labels[changed].tolist())
+    for index, color in zip(changed.tolist(), theme_rgba[changed].tolist()):
+        key = tuple(color)
+        group = group_lookup.setdefault(key, len(keys))
+        if group == len(keys):
+            keys.append(key)
+        labels[index] = group
+        affected.add(group)
+        ungrouped_properties.discard(index)
+
+    # groups left empty are kept, the filter stage hides them
+    members = list(theme_groups.members)
+    members += [None] * (len(keys) - len(members))
+    for group in affected:
+        members[group] = np.flatnonzero(labels == group)
+    group_colors = np.array(keys, dtype=np.float32).reshape(-1, 4)
+    theme_groups = ThemeGroups(group_colors, keys, members, labels)
+    path_order_cache.clear()
+
+
+# Grid index of theme_hsv for Filter by Color, as [theme_hsv, cells, order, offsets].
+# Writes move the written properties to their new cell, the properties are sorted
+# by cell again on the next query
+color_grid = None
+
+
+def get_color_grid():
+    global color_grid
+    if color_grid is None or color_grid[0] is not theme_hsv:
+        cells = color_math.hsv_cells(theme_hsv)
+        color_grid = [theme_hsv, cells] + list(color_math.hsv_grid(cells))
+    elif color_grid[2] is None:
+        color_grid[2:4] = color_math.hsv_grid(color_grid[1])
+    return color_grid
+
+
+def update_color_grid(indices):
+    if color_grid is None or color_grid[0] is not theme_hsv or len(indices) == 0:
+        return
+    cells = color_math.hsv_cells(theme_hsv[indices])
+    if not np.array_equal(cells, color_grid[1][indices]):
+        color_grid[1][indices] = cells
+        color_grid[2:4] = None, None
+
+
+def get_color_filter_mask(theme_edit):
+    """The properties within the Filter by Color tolerance of color_filter, the hue wraps around"""
+    tolerance = (theme_edit.color_filter_h,
+                 theme_edit.color_filter_s, theme_edit.color_filter_v)
+    grid = get_color_grid()
+    matches = color_math.query_hsv_grid(theme_hsv, grid[2], grid[3],
+                                        color_math.rgb_to_hsv(theme_edit.color_filter[0:3]), tolerance)
+    mask = np.zeros(len(theme_properties), dtype=bool)
+    mask[matches] = True
+    return mask
+
+
+def filter_theme_groups(theme_edit):
+    """Returns False if the filters list the same properties of the same groups as before"""
+    global filter_mask
+    global filtered_groups
+    mask = np.ones(len(theme_properties), dtype=bool)
+    if theme_edit.filter_by_color:
+        mask &= get_color_filter_mask(theme_edit)
+    if theme_edit.filter_by_name:
+        mask &= get_name_filter_mask(theme_edit.name_filter)
+    if (filtered_groups is theme_groups and filter_mask is not None and
+            np.array_equal(mask, filter_mask)):
+        return False
+    filter_mask = mask
+    filtered_groups = theme_groups
+
+    global filtered_members
+    filtered_members = [members[mask[members]]
+                        for members in theme_groups.members]
+    return True
+
+
+def sort_theme_groups(theme_edit):
+    global sorted_groups
+    global group_visible
+    global group_order
+    visible = np.array([i for i, members in enumerate(filtered_members) if len(members)],
+                       dtype=int)
+    counts = np.array([len(filtered_members[i]) for i in visible], dtype=int)
+    first = np.array([filtered_members[i][0] for i in visible], dtype=int)
+
+    order = color_math.sort_groups(theme_groups.colors[visible], counts, first,
+                                   theme_edit.sort_type)
+    sorted_groups = visible[order]
+
+    # UI list filter flags and new order, hidden groups go after the visible ones
+    group_count = len(theme_groups.keys)
+    group_visible = np.zeros(group_count, dtype=bool)
+    group_visible[visible] = True
+    hidden = np.flatnonzero(group_visible == False)
+    group_order = np.empty(group_count, dtype=int)
+    group_order[np.concatenate((sorted_groups, hidden)).astype(int)] = np.arange(group_count)
+    group_order = group_order.tolist()
+
+
+def publish_color_list(theme_edit):
+    """Update colors and ordered_colors with the filtered groups.
+    The color_groups collection is only refilled after a regroup,
+    returns True if it was"""
+    global colors
+    global ordered_colors
+    global published_groups
+    keys = theme_groups.keys
+    ordered_colors = list(keys)
+    colors = dict(zip(keys, filtered_members))
+
+    if published_groups is theme_groups:
+        return False
+    # patched groups keep the published ones as a prefix, so the selection is still valid
+    patched = (published_groups is not None and
+               published_groups.keys == keys[:len(published_groups.keys)])
+    published_groups = theme_groups
+    theme_colors = theme_edit.color_groups
+    set_collection_length(theme_colors, len(keys))
+    theme_colors.foreach_set("color", theme_groups.colors.reshape(-1))
+    theme_colors.foreach_set("index", np.arange(len(keys), dtype=np.int32))
+    return not patched
+
 
+def invalidate_color_list(stage):
+    global color_list_stage
+    color_list_stage = min(color_list_stage, stage)
 
-def build_color_list():
+
+@profiling.profiled("build_color_list")
+def build_color_list(stage=STAGE_READ):
+    """Run the color list stages from the given one (read, group, filter, sort),
+    stages that were invalidated since the last build are run again too"""
+    complete_rebuild()
     global CanPushUndo
     CanPushUndo = False
     theme_edit = bpy.context.window_manager.theme_edit
-    filter_by_color = theme_edit.filter_by_color
-    color_filter = theme_edit.color_filter
-    color_filter_hsv = mathutils.Color(color_filter[0:3])
-    filter_by_name = theme_edit.filter_by_name
-    name_filter = theme_edit.name_filter
-    theme_colors = theme_edit.color_groups
-    sort_terms = theme_edit.sort_terms
     global already_built
     already_built = False
 
@@ -183,82 +790,37 @@ def build_color_list():
     global theme_properties
 
     if theme_properties is None:
-        theme_properties = []
-
-        def inspect_struct(struct, path=""):
-            for key in dir(struct):
-                if key in ["bl_rna", "rna_type"]:
-                    continue
-                attribute = getattr(struct, key)
-                name = ""
-                if key in struct.bl_rna.properties:
-                    name = struct.bl_rna.properties[key].name
-                separator = "::" if path != "" else ""
-                if issubclass(type(attribute), bpy.types.bpy_struct):
-                    inspect_struct(attribute, path+separator+name)
-                else:
-                    attribute = getattr(struct, key)
-                    color = color_to_tuple(attribute)
-                    if color:
-                        theme_properties.append(ColorTuple(
-                            struct, key, path+separator+name))
-
-        inspect_struct(theme)
-
-    global colors
-    colors = {}
-    global ordered_colors
-    ordered_colors = {}
-
-    set_collection_length(theme_edit.color_paths, 0)
-
-    for prop in theme_properties:
-        struct, key, path = prop
-        attribute = getattr(struct, key)
-        color = color_to_tuple(attribute)
-
-        if color:
-            if filter_by_color:
-                hsv = mathutils.Color(color[0:3])
-                if (math.isclose(hsv.h, color_filter_hsv.h, abs_tol=theme_edit.color_filter_h) == False or
-                    math.isclose(hsv.s, color_filter_hsv.s, abs_tol=theme_edit.color_filter_s) == False or
-                        math.isclose(hsv.v, color_filter_hsv.v, abs_tol=theme_edit.color_filter_v) == False):
-                    continue
-            if filter_by_name:
-                # if not re.search(name_filter, path, re.IGNORECASE):
-                if not filter_string(path, name_filter):
-                    continue
-
-            color_tuple = ColorTuple(struct, key, path)
-            if color in colors:
-                colors[color].append(color_tuple)
-            else:
-                colors[color] = [color_tuple]
-
-    def build_theme_colors(dic):
-        def user_sort(e):
-            return len(dic[e])
-
-        def color_sort(e):
-            e = dic[e][0]
-            attribute = getattr(e.struct, e.key)
-            color = color_to_tuple(attribute)
-            color = mathutils.Color(color[0:3])
-            return (color.s == 0, -color.h, color.s, color.v)
-            # return -color.h * 1000000 + color.s * 100 + color.v
-
-        sort = user_sort if theme_edit.sort_type == 'USERS' else color_sort
-        global ordered_colors
-        ordered_colors = sorted(dic, key=sort, reverse=True)
-        set_collection_length(theme_colors, len(ordered_colors))
-
-        for i, key in enumerate(ordered_colors):
-            theme_colors[i].color = key
-            theme_colors[i].index = i
-
-    build_theme_colors(colors)
-    sort_paths(sort_terms)
-    theme_edit.group_index = 0
+        theme_properties = read_theme_cache(theme)
+        if theme_properties is None:
+            theme_properties = inspect_theme(theme)
+            write_theme_cache(theme_properties)
+        invalidate_color_list(STAGE_READ)
+
+    if ungrouped_properties:
+        invalidate_color_list(STAGE_GROUP)
+
+    global color_list_stage
+    pending_stage = color_list_stage
+    stage = min(stage, color_list_stage)
+    if stage <= STAGE_READ:
+        read_theme_colors()
+        stage = STAGE_GROUP
+    if stage <= STAGE_GROUP:
+        group_theme_colors()
+    if stage <= STAGE_FILTER:
+        if not filter_theme_groups(theme_edit) and stage == STAGE_FILTER and pending_stage == STAGE_DONE:
+            # the same properties are listed, so the sorted groups are still valid
+            stage = STAGE_DONE
+    if stage <= STAGE_SORT:
+        sort_theme_groups(theme_edit)
+    color_list_stage = STAGE_DONE
+
+    regrouped = publish_color_list(theme_edit)
+    index = theme_edit.group_index
+    if regrouped or index >= len(ordered_colors) or not group_visible[index]:
+        set_collection_length(theme_edit.color_paths, 0)
+        theme_edit.group_index = sorted_groups[0] if len(
+            sorted_groups) else 0
     if highlight:
         theme_edit.highlight_selected = True
 
@@ -268,134 +830,387 @@ def build_color_list():
     CanPushUndo = True
 
 
-def build_color_list_callback(self, context):
-    build_color_list()
+# Full rebuilds requested from the UI run in a bpy.app.timers callback,
+# processing the rebuild_job generator in time slices so the interface doesn't stall
+REBUILD_TIME_SLICE = 0.01
+rebuild_job = None
+rebuild_progress = 0.0
+rebuild_push_undo = False
+rebuild_highlight = False
 
 
-def set_color(property, color):
-    try:
-        setattr(property.struct, property.key, color[0:3])
-    except ValueError:
-        setattr(property.struct, property.key, color)
+def rebuild_steps():
+    """Read the theme in chunks into a new theme_rgba table"""
+    global theme_properties
+    global rebuild_progress
+    theme = bpy.context.preferences.themes[0]
+    rebuild_progress = 0.0
+
+    properties = theme_properties
+    if properties is None:
+        properties = read_theme_cache(theme)
+        if properties is None:
+            properties = ThemeProperties()
+            yield from walk_theme(theme, properties)
+            write_theme_cache(properties)
+        theme_properties = properties
+        invalidate_color_list(STAGE_READ)
+
+    rgba = np.ones((len(properties), 4), dtype=np.float32)
+    for progress in read_theme_colors_steps(rgba):
+        rebuild_progress = progress
+        yield
+    # keep the properties written while the rebuild was running
+    if theme_rgba is not None and len(theme_rgba) == len(rgba):
+        for index in UndoDirty:
+            rgba[index] = theme_rgba[index]
+    set_theme_colors(rgba)
+
+
+def request_rebuild(push_undo=False):
+    """Schedule a full color list rebuild, replacing the one in progress if there's any"""
+    global rebuild_job
+    global rebuild_push_undo
+    global rebuild_highlight
+    theme_edit = bpy.context.window_manager.theme_edit
+    if rebuild_job is None:
+        rebuild_push_undo = False
+        # the highlight colors must not be read as theme colors
+        rebuild_highlight = theme_edit.highlight_selected
+        theme_edit.highlight_selected = False
+    rebuild_push_undo = rebuild_push_undo or push_undo
+    rebuild_job = rebuild_steps()
+
+    if bpy.app.background:
+        complete_rebuild()
+    elif not bpy.app.timers.is_registered(process_rebuild):
+        bpy.app.timers.register(process_rebuild)
+
+
+@profiling.profiled("process_rebuild")
+def process_rebuild():
+    global rebuild_job
+    deadline = time.perf_counter() + REBUILD_TIME_SLICE
+    while rebuild_job is not None:
+        try:
+            next(rebuild_job)
+        except StopIteration:
+            rebuild_job = None
+            finish_rebuild()
+            break
+        if time.perf_counter() > deadline:
+            break
+    redraw_theme_editor()
+    if rebuild_job is not None:
+        return 0.001
+    return None
+
+
+def finish_rebuild():
+    theme_edit = bpy.context.window_manager.theme_edit
+    build_color_list(STAGE_GROUP)
+    theme_edit.highlight_selected = rebuild_highlight
+    if rebuild_push_undo:
+        push_undo_step(full=True)
 
 
-def set_color_group(group_index, color):
-    for property in color_paths(group_index):
-        set_color(property, color)
+def complete_rebuild():
+    """Run the rebuild in progress to the end, so a synchronous build
+    doesn't start from the colors read before it"""
+    while rebuild_job is not None:
+        process_rebuild()
 
 
-last_index = None
+def redraw_theme_editor():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
 
 
-def group_index_callback(self, context):
+# Theme edits made outside of the addon, like in the Preferences theme editor,
+# are found by comparing a snapshot of the theme with theme_rgba
+THEME_CHECK_INTERVAL = 1.0
+
+
+@profiling.profiled("check_theme_changes")
+def check_theme_changes():
+    theme_edit = bpy.context.window_manager.theme_edit
+    if theme_rgba is None or rebuild_job is not None or merge_preview is not None:
+        return THEME_CHECK_INTERVAL
+
+    rgba = np.ones_like(theme_rgba)
+    for progress in read_theme_colors_steps(rgba, max(len(rgba), 1)):
+        pass
+    changed = np.flatnonzero(np.any(rgba != theme_rgba, axis=1))
+    if len(changed):
+        apply_theme_changes(theme_edit, rgba, changed)
+    return THEME_CHECK_INTERVAL
+
+
+def apply_theme_changes(theme_edit, rgba, changed):
+    """Patch the color list with the properties changed outside of the addon.
+    Like the writes of the addon, the changed properties leave the highlight overlay"""
+    for index in changed.tolist():
+        highlight_originals.pop(index, None)
+        highlight_painted.pop(index, None)
+    theme_rgba[changed] = rgba[changed]
+    theme_hsv[changed] = color_math.rgb_to_hsv(rgba[changed, 0:3])
+    UndoDirty.update(changed.tolist())
+    update_color_grid(changed)
+    update_contrast_ratios(changed)
+    if theme_groups is None:
+        return
+
     global CanPushUndo
+    patch_theme_groups(np.union1d(changed, list(ungrouped_properties)).astype(int))
+    build_color_list(STAGE_FILTER)
     CanPushUndo = False
-    global last_index
-    new_index = self.group_index
+    load_path_list(theme_edit)
+    CanPushUndo = True
+    push_undo_step()
+    redraw_theme_editor()
 
-    if last_index is not None:
-        for i, color_path in enumerate(self.color_paths):
-            prop = color_paths(last_index)[i]
-            set_color(prop, color_path.color)
 
-    update_path_collection_length()
+@profiling.profiled_update("filter_color_list_callback")
+def filter_color_list_callback(self, context):
+    build_color_list(STAGE_FILTER)
 
-    for i, color_path in enumerate(self.color_paths):
-        prop = color_paths(new_index)[i]
-        color_path.index = i
-        color_path.color = color_to_tuple(getattr(prop.struct, prop.key))
 
-    if self.highlight_selected:
-        set_color_group(new_index, self.highlight_color)
+@profiling.profiled_update("sort_color_list_callback")
+def sort_color_list_callback(self, context):
+    build_color_list(STAGE_SORT)
 
-    last_index = new_index
-    global last_property_index
-    last_property_index = 0
-    CanPushUndo = True
 
+def write_colors(updates, highlight=False):
+    """Write a batch of (property index, color) updates to the theme, see write_color_table"""
+    updates = list(updates)
+    if not updates:
+        return
+    indices = np.array([update[0] for update in updates], dtype=int)
+    rgba = np.array([tuple(color[0:4]) if len(color) > 3 else tuple(color[0:3]) + (1.0,)
+                     for index, color in updates], dtype=np.float32)
+    write_color_table(indices, rgba, highlight)
+
+
+def write_color_table(indices, rgba, highlight=False):
+    """Write the N x 4 rgba colors to the properties at indices.
+    Colors are clamped like the theme properties, and the properties that already have
+    their color are skipped. 3 channel colors are written with opaque alpha.
+    Unless it's the highlight overlay writing, the written properties leave the overlay."""
+    if len(indices) == 0:
+        return
+    if highlight_originals and not highlight:
+        for index in indices.tolist():
+            highlight_originals.pop(index, None)
+            highlight_painted.pop(index, None)
+    rgba = np.clip(rgba, 0.0, 1.0).astype(np.float32, copy=False)
+    rgba[theme_properties.size_array()[indices] == 3, 3] = 1.0
+
+    if theme_rgba is None:
+        changed = np.ones(len(indices), dtype=bool)
+    else:
+        changed = np.any(rgba != theme_rgba[indices], axis=1)
+        # theme_rgba misses the edits check_theme_changes didn't find yet,
+        # so the theme itself must have the colors to skip
+        same = np.flatnonzero(~changed)
+        changed[same] = np.any(rgba[same] != read_theme_rows(indices[same]), axis=1)
+    changed = np.flatnonzero(changed)
+    indices = indices[changed]
+    rgba = rgba[changed]
+    for index, row in zip(indices.tolist(), rgba.tolist()):
+        theme_properties.set(index, row)
+
+    UndoDirty.update(indices.tolist())
+    if profiling.active:
+        profiling.count_write(len(indices))
+    if theme_rgba is not None:
+        theme_rgba[indices] = rgba
+        theme_hsv[indices] = color_math.rgb_to_hsv(rgba[:, 0:3])
+        update_grouped_colors(indices)
+        update_color_grid(indices)
+        if not highlight:
+            update_contrast_ratios(indices)
+
+
+def set_color(index, color):
+    write_colors(((index, color),))
 
-last_property_index = 0
 
+def set_color_group(group_index, color):
+    write_colors((index, color) for index in color_paths(group_index).tolist())
 
-def property_index_callback(self, context):
+
+# The highlight is an overlay over the theme colors, highlight_originals keeps the
+# original color of every highlighted property and highlight_painted the color painted over it.
+# Selection changes only schedule the new highlight, it's applied once per frame by a timer.
+highlight_originals = {}
+highlight_painted = {}
+highlight_pending = None
+
+
+def highlight_targets(theme_edit):
+    """The highlight color of each property for the current selection, by property index"""
+    index = theme_edit.group_index
+    if not theme_edit.highlight_selected or index >= len(ordered_colors):
+        return {}
+    group_color = tuple(theme_edit.highlight_color)
+    targets = {prop: group_color for prop in color_paths(index).tolist()}
+    if theme_edit.paths_index < len(path_list):
+        targets[path_list[theme_edit.paths_index]] = tuple(
+            theme_edit.property_highlight_color)
+    return targets
+
+
+def apply_highlight(targets):
+    """Paint the targets over the theme, restoring the properties that are no longer highlighted.
+    Only the properties whose highlight changed are written"""
+    global highlight_pending
+    highlight_pending = None
+    updates = []
+    for index in [index for index in highlight_painted if index not in targets]:
+        del highlight_painted[index]
+        updates.append((index, highlight_originals.pop(index)))
+    for index, color in targets.items():
+        if highlight_painted.get(index) != color:
+            if index not in highlight_originals:
+                highlight_originals[index] = tuple(theme_rgba[index].tolist())
+            highlight_painted[index] = color
+            updates.append((index, color))
+    write_colors(updates, highlight=True)
+
+
+def request_highlight(theme_edit):
+    """Schedule the highlight of the current selection for the next frame"""
+    global highlight_pending
+    highlight_pending = highlight_targets(theme_edit)
+    if bpy.app.background:
+        apply_highlight(highlight_pending)
+    elif not bpy.app.timers.is_registered(flush_highlight):
+        bpy.app.timers.register(flush_highlight, first_interval=0.0)
+
+
+@profiling.profiled("flush_highlight")
+def flush_highlight():
+    if highlight_pending is not None:
+        apply_highlight(highlight_pending)
+    return None
+
+
+def original_color(index):
+    """The property color without the highlight"""
+    original = highlight_originals.get(index)
+    if original is not None:
+        return original
+    return color_to_tuple(theme_properties.get(index))
+
+
+loading_paths = False
+
+
+def load_path_list(theme_edit):
+    """Load the properties of the active group into theme_edit.color_paths"""
+    global path_list
+    update_path_collection_length()
+
+    index = theme_edit.group_index
+    path_list = []
+    if index < len(ordered_colors):
+        path_list = group_properties(index).tolist()
+    # loading the items isn't an edit, their update callback must not write the theme
+    global loading_paths
+    loading_paths = True
+    for i, color_path in enumerate(theme_edit.color_paths):
+        color_path.index = i
+        color_path.color = original_color(path_list[i])
+    loading_paths = False
+
+
+@profiling.profiled_update("group_index_callback")
+def group_index_callback(self, context):
     global CanPushUndo
     CanPushUndo = False
-    global last_property_index
-    new_index = self.paths_index
-    group_index = self.group_index
-    highlight_color = self.highlight_color
-    property_highlight_color = self.property_highlight_color
-    if self.highlight_selected:
-        set_color(color_paths(group_index)[
-                  last_property_index], highlight_color)
-        set_color(color_paths(group_index)[
-                  new_index], property_highlight_color)
-    last_property_index = new_index
+    load_path_list(self)
+    if self.highlight_selected or highlight_painted:
+        request_highlight(self)
     CanPushUndo = True
 
 
-def highlight_selected_callback(self, context):
-    theme_edit = self
-    highlight = theme_edit.highlight_selected
-    highlight_color = theme_edit.highlight_color
-    property_highlight_color = theme_edit.property_highlight_color
-    index = theme_edit.group_index
-    property_index = theme_edit.paths_index
-
-    if ordered_colors and index < len(ordered_colors):
-        if highlight:
-            set_color_group(index, highlight_color)
-            prop = color_paths(index)[property_index]
-            set_color(prop, property_highlight_color)
-        else:
-            for i, color_path in enumerate(theme_edit.color_paths):
-                prop = color_paths(last_index)[i]
-                set_color(prop, color_path.color)
+@profiling.profiled_update("property_index_callback")
+def property_index_callback(self, context):
+    if self.highlight_selected:
+        request_highlight(self)
 
 
-def sort_terms_callback(self, context):
-    sort_terms = context.window_manager.theme_edit.sort_terms
-    sort_paths(sort_terms)
+@profiling.profiled_update("highlight_selected_callback")
+def highlight_selected_callback(self, context):
+    # applied right away, the theme is read without the highlight after turning it off
+    apply_highlight(highlight_targets(self))
 
 
-last_color = {
-    "color": (0, 0, 0, 0),
-    "count": 0
-}
+# Recent colors are debounced, every color update restarts the wait and once there are
+# no updates for the history delay, the last color is pushed to the palette and the undo history.
+HISTORY_LENGTH = 20
+color_history = collections.deque(maxlen=HISTORY_LENGTH)
+last_color = None
+last_color_time = 0.0
+last_color_undo = False
 
 
-def set_last_color(color):
-    if not hasattr(bpy.data, "palettes"):
-        return
-    # first run
+def get_history_palette():
     if "theme_edit" not in bpy.data.palettes:
         palette = bpy.data.palettes.new("theme_edit")
         bpy.context.window_manager.theme_edit.history_palette = palette
-        for i in range(0, 20):
+        for i in range(0, HISTORY_LENGTH):
             palette.colors.new()
+    return bpy.data.palettes["theme_edit"]
 
-    global last_color
-    last_color["color"] = color
-    count = last_color["count"] + 1
-    last_color["count"] = count
-
-    global CanPushUndo
-    local_push_undo = CanPushUndo
 
-    def delayed_set_last_color():
-        global last_color
-        if count == last_color["count"]:
-            palette = bpy.data.palettes["theme_edit"].colors
-            for i in range(len(palette)-1, 0, -1):
-                palette[i].color = palette[i - 1].color
-            palette[0].color = last_color["color"][0:3]
-            if local_push_undo:
-                push_undo_step()
-
-    bpy.app.timers.register(delayed_set_last_color, first_interval=0.5)
+def set_last_color(color):
+    if not hasattr(bpy.data, "palettes"):
+        return
+    global last_color
+    global last_color_time
+    global last_color_undo
+    last_color = tuple(color[0:3])
+    last_color_time = time.perf_counter()
+    last_color_undo = last_color_undo or CanPushUndo
+    if not bpy.app.timers.is_registered(flush_last_color):
+        bpy.app.timers.register(flush_last_color, first_interval=history_delay())
+
+
+def history_delay():
+    preferences = get_preferences()
+    return preferences.history_delay if preferences else 0.5
+
+
+@profiling.profiled("flush_last_color")
+def flush_last_color():
+    global last_color_undo
+    remaining = last_color_time + history_delay() - time.perf_counter()
+    if remaining > 0:
+        return remaining
+
+    palette_colors = get_history_palette().colors
+    if not color_history:
+        # continue the history saved in the palette
+        saved = np.empty(len(palette_colors) * 3, dtype=np.float32)
+        palette_colors.foreach_get("color", saved)
+        color_history.extend(map(tuple, saved.reshape(-1, 3).tolist()))
+    color_history.appendleft(last_color)
+    history = np.zeros((len(palette_colors), 3), dtype=np.float32)
+    count = min(len(color_history), len(history))
+    history[0:count] = list(color_history)[0:count]
+    palette_colors.foreach_set("color", history.reshape(-1))
+
+    if last_color_undo:
+        last_color_undo = False
+        push_undo_step()
+    return None
 
 
 class ColorGroupProperties(bpy.types.PropertyGroup):
+    @profiling.profiled_update("ColorGroupProperties.color_updated")
     def color_updated(self, context):
         if already_built == False:
             return
@@ -408,8 +1223,9 @@ class ColorGroupProperties(bpy.types.PropertyGroup):
         set_last_color(self.color)
 
         if self.index == theme_edit.group_index:
-            for path in theme_edit.color_paths:
-                path.color = self.color
+            for prop, path in zip(path_list, theme_edit.color_paths):
+                if filter_mask[prop]:
+                    path.color = self.color
 
     color: bpy.props.FloatVectorProperty(
         name="Color", size=4, subtype='COLOR_GAMMA', min=0.0, max=1.0, update=color_updated)
@@ -418,10 +1234,11 @@ class ColorGroupProperties(bpy.types.PropertyGroup):
 
 
 class ColorPathsPropertyGroup(bpy.types.PropertyGroup):
+    @profiling.profiled_update("ColorPathsPropertyGroup.color_updated")
     def color_updated(self, context):
-        group_index = context.window_manager.theme_edit.group_index
-        prop = color_paths(group_index)[self.index]
-        set_color(prop, self.color)
+        if loading_paths:
+            return
+        set_color(path_list[self.index], self.color)
         set_last_color(self.color)
 
     color: bpy.props.FloatVectorProperty(
@@ -442,12 +1259,16 @@ class VIEW_3D_UL_color_list(bpy.types.UIList):
     def draw_filter(self, context, layout):
         pass
 
+    def filter_items(self, context, data, propname):
+        if group_visible is None or len(group_visible) != len(getattr(data, propname)):
+            return [], []
+        flags = (group_visible * self.bitflag_filter_item).tolist()
+        return flags, group_order
+
 
 class VIEW_3D_UL_path_list(bpy.types.UIList):
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
-        color_index = context.window_manager.theme_edit.group_index
-        color = color_paths(color_index)
-        layout.label(text=(color[index].path))
+        layout.label(text=(theme_properties.path(path_list[index])))
         row = layout.row()
         row.alignment = 'RIGHT'
         row.prop(item, 'color', text="")
@@ -455,6 +1276,13 @@ class VIEW_3D_UL_path_list(bpy.types.UIList):
     def draw_filter(self, context, layout):
         pass
 
+    def filter_items(self, context, data, propname):
+        if len(path_list) != len(getattr(data, propname)):
+            return [], []
+        visible = filter_mask[path_list]
+        flags = (visible * self.bitflag_filter_item).tolist()
+        return flags, get_path_order(data.group_index, data.sort_terms)
+
 
 last_theme = None
 
@@ -469,8 +1297,23 @@ class WM_OT_theme_edit_execute_preset(bpy.types.Operator):
     def execute(self, context):
         global last_theme
         last_theme = None
+        theme_edit = context.window_manager.theme_edit
+        highlight = theme_edit.highlight_selected
+        theme_edit.highlight_selected = False
         bpy.ops.script.execute_preset(
             filepath=self.filepath, menu_idname="THEME_EDIT_MT_Presets")
+
+        # The preset only sets the colors it has, so the new colors are patched into the
+        # current table instead of reading the whole theme again
+        preset_colors = get_preset_colors([self.filepath]).get(self.filepath)
+        if preset_colors is not None and theme_rgba is not None and rebuild_job is None:
+            rgba, found = preset_table(preset_colors)
+            rgba[~found] = theme_rgba[~found]
+            set_theme_colors(rgba)
+            build_color_list(STAGE_GROUP)
+            push_undo_step(full=True)
+            last_theme = THEME_EDIT_MT_Presets.bl_label
+        theme_edit.highlight_selected = highlight
         return {'FINISHED'}
 
 
@@ -483,7 +1326,90 @@ class THEME_EDIT_MT_Presets(bpy.types.Menu):
         ("preferences.themes[0]", "Theme"),
         ("preferences.ui_styles[0]", "ThemeStyle"),
     )
-    draw = bpy.types.Menu.draw_preset
+
+    def draw(self, context):
+        layout = self.layout
+        filepaths = preset_xml.find_presets(bpy.utils.preset_paths(self.preset_subdir))
+        icons = preset_icons(filepaths)
+        for filepath in filepaths:
+            name = bpy.path.display_name(os.path.basename(filepath), title_case=False)
+            props = layout.operator(self.preset_operator, text=name,
+                                    icon_value=icons.get(filepath, 0), translate=False)
+            props.filepath = filepath
+
+
+# Presets are shown in the menu with a swatch of their most used colors,
+# the swatches are kept in the preset index and drawn as bpy.utils.previews icons
+SWATCH_COLORS = 6
+SWATCH_ICON_SIZE = 32
+preset_previews = None
+# (mtime, size) of the preset file each preview was drawn from
+preset_preview_keys = {}
+
+
+def preset_swatch(preset_colors):
+    """The most used colors of a preset like in the USERS sort, and their user counts"""
+    groups = group_color_table(preset_colors.rgba)
+    counts = np.array([len(members) for members in groups.members], dtype=int)
+    first = np.array([members[0] for members in groups.members], dtype=int)
+    order = color_math.sort_groups(groups.colors, counts, first, 'USERS')[0:SWATCH_COLORS]
+    return {"colors": groups.colors[order].tolist(), "counts": counts[order].tolist()}
+
+
+def get_preset_swatches(filepaths):
+    """The swatch of each preset, only computed again when the preset file changes"""
+    presets = get_preset_colors(filepaths)
+    changed = False
+    swatches = {}
+    for filepath, preset_colors in presets.items():
+        entry = preset_index["presets"][filepath]
+        if "swatch" not in entry:
+            entry["swatch"] = preset_swatch(preset_colors)
+            changed = True
+        swatches[filepath] = entry["swatch"]
+    if changed:
+        preset_xml.save_preset_index(preset_index, preset_index_path())
+    return swatches
+
+
+def swatch_icon_pixels(swatch):
+    """Vertical stripes of the swatch colors with widths by user count, as 32 bit RGBA pixels"""
+    pixels = np.zeros((SWATCH_ICON_SIZE, SWATCH_ICON_SIZE, 4), dtype=np.uint8)
+    if swatch and swatch["colors"]:
+        counts = np.array(swatch["counts"], dtype=float)
+        edges = np.round(np.cumsum(counts) / counts.sum() * SWATCH_ICON_SIZE).astype(int)
+        stripes = np.searchsorted(edges, np.arange(SWATCH_ICON_SIZE), side='right')
+        colors = np.round(np.array(swatch["colors"]) * 255).astype(np.uint8)
+        pixels[:, :] = colors[np.minimum(stripes, len(colors) - 1)]
+        pixels[:, :, 3] = 255
+    return pixels.reshape(-1).view(np.int32)
+
+
+def preset_icons(filepaths):
+    """The icon_id of the swatch preview of each preset"""
+    global preset_previews
+    if preset_previews is None:
+        preset_previews = bpy.utils.previews.new()
+    keys = {}
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        keys[filepath] = (stat.st_mtime_ns, stat.st_size)
+
+    outdated = [filepath for filepath, key in keys.items()
+                if filepath not in preset_previews or preset_preview_keys.get(filepath) != key]
+    if outdated:
+        swatches = get_preset_swatches(outdated)
+        for filepath in outdated:
+            preview = preset_previews.get(filepath)
+            if preview is None:
+                preview = preset_previews.new(filepath)
+            preview.icon_size = (SWATCH_ICON_SIZE, SWATCH_ICON_SIZE)
+            preview.icon_pixels = swatch_icon_pixels(swatches.get(filepath)).tolist()
+            preset_preview_keys[filepath] = keys[filepath]
+    return {filepath: preset_previews[filepath].icon_id for filepath in keys}
 
 
 class ThemeEditAddPresetInterfaceTheme(AddPresetBase, bpy.types.Operator):
@@ -514,6 +1440,244 @@ class WM_OT_theme_edit_open_preset_folder(bpy.types.Operator):
         return {'FINISHED'}
 
 
+# The last comparison, as (theme_properties, the compared tables paths, ThemeDiff).
+# The groups of theme_edit.diff_items are in the same order as the ThemeDiff groups.
+theme_diff_state = None
+# Blender needs a reference to the dynamic enum items
+diff_preset_items = []
+
+
+def get_diff_preset_items(self, context):
+    global diff_preset_items
+    diff_preset_items = [
+        (filepath, bpy.path.display_name(os.path.basename(filepath), title_case=False), filepath)
+        for filepath in preset_xml.find_presets(bpy.utils.preset_paths("interface_theme"))]
+    return diff_preset_items or [('NONE', "No Presets", "")]
+
+
+def live_colors():
+    """The theme_rgba table without the highlight overlay"""
+    rgba = theme_rgba.copy()
+    for index, color in highlight_originals.items():
+        rgba[index] = color
+    return rgba
+
+
+@profiling.profiled("compare_themes")
+def compare_themes(theme_edit):
+    """Diff the theme against the selected preset, or two undo levels against each other,
+    and load the differences into theme_edit.diff_items. Returns False if the preset can't be read"""
+    global theme_diff_state
+    theme_paths = theme_properties.data_paths()
+    if theme_edit.diff_type == 'PRESET':
+        preset_colors = get_preset_colors([theme_edit.diff_preset]).get(theme_edit.diff_preset)
+        if preset_colors is None:
+            return False
+        paths_b = preset_colors.paths
+        diff = theme_diff.diff_tables(theme_paths, live_colors(), paths_b, preset_colors.rgba,
+                                      theme_edit.diff_tolerance)
+    else:
+        paths_b = theme_paths
+        diff = theme_diff.diff_tables(theme_paths, undo_level_colors(theme_edit.diff_undo_from),
+                                      theme_paths, undo_level_colors(theme_edit.diff_undo_to),
+                                      theme_edit.diff_tolerance)
+    theme_diff_state = (theme_properties, (theme_paths, paths_b), diff)
+
+    items = theme_edit.diff_items
+    set_collection_length(items, len(diff.members))
+    items.foreach_set("before", diff.before.reshape(-1))
+    items.foreach_set("after", diff.after.reshape(-1))
+    items.foreach_set("select", np.zeros(len(diff.members), dtype=bool))
+    theme_edit.diff_index = 0
+    return True
+
+
+def get_theme_diff():
+    """The last comparison, None if the theme properties were read again since then"""
+    if theme_diff_state is None or theme_diff_state[0] is not theme_properties:
+        return None
+    return theme_diff_state[2]
+
+
+class ThemeDiffItem(bpy.types.PropertyGroup):
+    select: bpy.props.BoolProperty(name="Select", description="Apply this difference")
+    before: bpy.props.FloatVectorProperty(
+        name="Before", size=4, subtype='COLOR_GAMMA', min=0.0, max=1.0)
+    after: bpy.props.FloatVectorProperty(
+        name="After", size=4, subtype='COLOR_GAMMA', min=0.0, max=1.0)
+
+
+class VIEW_3D_UL_diff_list(bpy.types.UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        diff = get_theme_diff()
+        if diff is None or index >= len(diff.members):
+            return
+        kind = diff.kinds[index]
+        members = diff.members[index]
+        row = layout.row(align=True)
+        row.prop(item, 'select', text="")
+        if len(members) == 1:
+            paths_a, paths_b = theme_diff_state[1]
+            row_a = diff.rows_a[members[0]]
+            row.label(text=paths_a[row_a] if row_a >= 0 else paths_b[diff.rows_b[members[0]]])
+        else:
+            row.label(text="{} ({} properties)".format(theme_diff.KIND_NAMES[kind], len(members)))
+        row = layout.row(align=True)
+        row.alignment = 'RIGHT'
+        # read only, the colors of the compared tables are the ones applied
+        row.enabled = False
+        if kind != theme_diff.ADDED:
+            row.prop(item, 'before', text="")
+        if kind == theme_diff.CHANGED:
+            row.label(text="", icon='FORWARD')
+        if kind != theme_diff.REMOVED:
+            row.prop(item, 'after', text="")
+
+    def draw_filter(self, context, layout):
+        pass
+
+
+@profiling.profiled("apply_diff")
+def apply_diff(theme_edit):
+    """Set the properties of the selected changed groups of the last comparison to their
+    color in the compared table. Returns False if nothing was selected"""
+    diff = get_theme_diff()
+    selected = np.zeros(len(theme_edit.diff_items), dtype=bool)
+    theme_edit.diff_items.foreach_get("select", selected)
+    updates = []
+    # added and removed properties are missing from one of the tables, so there's nothing to apply
+    for group in np.flatnonzero(selected[0:len(diff.members)]).tolist():
+        if diff.kinds[group] == theme_diff.CHANGED:
+            color = tuple(diff.after[group].tolist())
+            updates.extend((index, color)
+                           for index in diff.rows_a[diff.members[group]].tolist())
+    if not updates:
+        return False
+
+    highlight = theme_edit.highlight_selected
+    theme_edit.highlight_selected = False
+    write_colors(updates)
+    build_color_list(STAGE_GROUP)
+    push_undo_step()
+    compare_themes(theme_edit)
+    theme_edit.highlight_selected = highlight
+    return True
+
+
+class WM_OT_theme_editor_compare(bpy.types.Operator):
+    bl_idname = "wm.theme_editor_compare"
+    bl_label = "Compare"
+    bl_description = "List the theme colors that differ from the selected preset, or between two undo steps"
+
+    @classmethod
+    def poll(cls, context):
+        return theme_rgba is not None and rebuild_job is None
+
+    def execute(self, context):
+        if not compare_themes(context.window_manager.theme_edit):
+            self.report({'ERROR'}, "Can't read the selected preset")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class WM_OT_theme_editor_apply_diff(bpy.types.Operator):
+    bl_idname = "wm.theme_editor_apply_diff"
+    bl_label = "Apply Selected"
+    bl_description = "Set the selected changed colors to their color in the compared preset or undo step"
+
+    @classmethod
+    def poll(cls, context):
+        return get_theme_diff() is not None and rebuild_job is None
+
+    def execute(self, context):
+        if not apply_diff(context.window_manager.theme_edit):
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+# The contrast audit checks text colors against the background colors of the same struct,
+# (foreground key, background key) pairs like the ones of widget colors and editor spaces
+CONTRAST_PAIRS = (
+    ("text", "inner"), ("text_sel", "inner_sel"),
+    ("text", "back"), ("text_hi", "back"), ("title", "back"),
+    ("header_text", "header"), ("header_text_hi", "header"),
+    ("button_text", "button"), ("button_text_hi", "button"), ("button_title", "button"),
+    ("list_text", "list"), ("list_text_hi", "list"), ("list_title", "list"),
+)
+AUDIT_PANEL_ENTRIES = 10
+PROFILING_PANEL_ENTRIES = 8
+
+# The audited property pairs of theme_properties, property_pairs[offsets[i]:offsets[i + 1]]
+# are the pairs of the property i
+ContrastIndex = namedtuple(
+    'ContrastIndex', ['properties', 'foreground', 'background', 'offsets', 'property_pairs'])
+contrast_index = None
+# The theme_rgba table the ratios were computed for and the contrast ratio of each pair,
+# kept up to date by write_color_table while the audit is on
+contrast_state = None
+
+
+def get_contrast_index():
+    global contrast_index
+    if contrast_index is None or contrast_index.properties is not theme_properties:
+        struct_keys = {}
+        for index, (struct_id, key) in enumerate(zip(theme_properties.struct_ids,
+                                                     theme_properties.keys)):
+            struct_keys.setdefault(struct_id, {})[key] = index
+        pairs = [(keys[foreground], keys[background]) for keys in struct_keys.values()
+                 for foreground, background in CONTRAST_PAIRS
+                 if foreground in keys and background in keys]
+        foreground, background = np.array(pairs, dtype=int).reshape(-1, 2).T
+        ends = np.concatenate([foreground, background])
+        counts = np.bincount(ends, minlength=len(theme_properties))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        property_pairs = np.tile(np.arange(len(pairs)), 2)[np.argsort(ends, kind='stable')]
+        contrast_index = ContrastIndex(theme_properties, foreground, background,
+                                       offsets, property_pairs)
+    return contrast_index
+
+
+def live_rows(indices):
+    """The theme_rgba rows of indices without the highlight overlay"""
+    rgba = theme_rgba[indices]
+    if highlight_originals:
+        for row, index in enumerate(indices.tolist()):
+            original = highlight_originals.get(index)
+            if original is not None:
+                rgba[row] = original
+    return rgba
+
+
+def get_contrast_ratios():
+    """The contrast ratio of every audited pair, all of them are checked after a theme read"""
+    global contrast_state
+    if contrast_state is None or contrast_state[0] is not theme_rgba:
+        index = get_contrast_index()
+        ratios = color_math.contrast_ratio(live_rows(index.foreground),
+                                           live_rows(index.background))
+        contrast_state = (theme_rgba, ratios)
+    return contrast_state[1]
+
+
+def update_contrast_ratios(indices):
+    """Check again the pairs of the written properties"""
+    if contrast_state is None or contrast_state[0] is not theme_rgba or len(indices) == 0:
+        return
+    index = contrast_index
+    starts = index.offsets[indices]
+    counts = index.offsets[indices + 1] - starts
+    positions = (np.repeat(starts - (np.cumsum(counts) - counts), counts) +
+                 np.arange(counts.sum()))
+    pairs = np.unique(index.property_pairs[positions])
+    contrast_state[1][pairs] = color_math.contrast_ratio(
+        live_rows(index.foreground[pairs]), live_rows(index.background[pairs]))
+
+
+def contrast_audit_callback(self, context):
+    global contrast_state
+    contrast_state = None
+
+
 class VIEW_3D_PT_theme_editor(bpy.types.Panel):
     bl_label = "Theme Editor"
     bl_space_type = 'VIEW_3D'
@@ -527,8 +1691,7 @@ class VIEW_3D_PT_theme_editor(bpy.types.Panel):
         current_theme = bpy.types.THEME_EDIT_MT_Presets.bl_label
         if last_theme != current_theme:
             last_theme = current_theme
-            build_color_list()
-            push_undo_step()
+            bpy.app.timers.register(functools.partial(request_rebuild, push_undo=True))
 
         row = layout.row(align=True)
         row.menu("THEME_EDIT_MT_Presets", text=current_theme)
@@ -542,9 +1705,15 @@ class VIEW_3D_PT_theme_editor(bpy.types.Panel):
         button_text = "Rebuild Color List" if already_built else "Build Color List"
         layout.operator("wm.build_theme_colors", text=button_text)
 
-        if colors is not None:
+        if rebuild_job is not None:
+            box = layout.box()
+            box.label(text="Building the color list... {:.0%}".format(rebuild_progress),
+                      icon='TIME')
+        elif colors is not None:
             layout.operator("wm.edit_theme_colors")
+            layout.operator("wm.apply_theme_lut")
             layout.operator("wm.merge_similar_theme_colors")
+            layout.operator("wm.reduce_theme_colors")
 
             row = layout.row()
             row.operator("wm.theme_editor_undo", text="Undo")
@@ -586,9 +1755,124 @@ class VIEW_3D_PT_theme_editor(bpy.types.Panel):
                 # if this is not the active palette inside the active paint mode + - doesn't work
                 layout.template_palette(
                     theme_edit, "history_palette", color=True)
+
+            self.draw_diff(layout, theme_edit)
+            self.draw_audit(layout, theme_edit)
         else:
             box = layout.box()
-            box.label("Please, build the color list", icon='ERROR')
+            box.label(text="Please, build the color list", icon='ERROR')
+
+        if profiling.enabled:
+            self.draw_profiling(layout)
+
+    def draw_diff(self, layout, theme_edit):
+        box = layout.box()
+        box.label(text="Differences")
+        box.row().prop(theme_edit, "diff_type", expand=True)
+        if theme_edit.diff_type == 'PRESET':
+            box.prop(theme_edit, "diff_preset", text="")
+        else:
+            row = box.row(align=True)
+            row.prop(theme_edit, "diff_undo_from", text="From")
+            row.prop(theme_edit, "diff_undo_to", text="To")
+        row = box.row()
+        row.prop(theme_edit, "diff_tolerance")
+        row.operator("wm.theme_editor_compare")
+
+        if get_theme_diff() is not None:
+            if theme_edit.diff_items:
+                box.template_list("VIEW_3D_UL_diff_list", "", theme_edit, "diff_items",
+                                  theme_edit, "diff_index")
+                box.operator("wm.theme_editor_apply_diff")
+            else:
+                box.label(text="No differences", icon='CHECKMARK')
+
+    def draw_audit(self, layout, theme_edit):
+        box = layout.box()
+        row = box.row()
+        row.prop(theme_edit, "contrast_audit")
+        if not theme_edit.contrast_audit:
+            return
+        row.prop(theme_edit, "min_contrast", text="Minimum")
+
+        ratios = get_contrast_ratios()
+        index = get_contrast_index()
+        failing = np.flatnonzero(ratios < theme_edit.min_contrast)
+        failing = failing[np.argsort(ratios[failing], kind='stable')]
+        box.label(text="{} of {} text colors below {:.1f}:1".format(
+            len(failing), len(ratios), theme_edit.min_contrast),
+            icon='ERROR' if len(failing) else 'CHECKMARK')
+
+        column = box.column(align=True)
+        for pair in failing[:AUDIT_PANEL_ENTRIES].tolist():
+            foreground = int(index.foreground[pair])
+            background = int(index.background[pair])
+            segments = theme_properties.segments(foreground)
+            row = column.row(align=True)
+            row.label(text="::".join(segments[:-1] + [segments[-1] + " / " +
+                                                      theme_properties.segments(background)[-1]]))
+            row.label(text="{:.1f}:1".format(ratios[pair]))
+            # read only, editing the theme properties here would skip write_colors
+            colors = row.row(align=True)
+            colors.enabled = False
+            colors.prop(theme_properties.struct(foreground), theme_properties.keys[foreground], text="")
+            colors.prop(theme_properties.struct(background), theme_properties.keys[background], text="")
+
+    def draw_profiling(self, layout):
+        box = layout.box()
+        row = box.row()
+        row.label(text="Profiling", icon='TIME')
+        row.operator("wm.theme_editor_dump_profile", text="", icon='EXPORT')
+        row.operator("wm.theme_editor_reset_profile", text="", icon='X')
+
+        column = box.column(align=True)
+        for entry in profiling.summary()[:PROFILING_PANEL_ENTRIES]:
+            row = column.row()
+            row.label(text=entry.name)
+            row.label(text="{} calls  {:.1f} ms avg  {:.1f} ms max  {} writes".format(
+                entry.calls, entry.seconds / entry.calls * 1000,
+                entry.max_seconds * 1000, entry.writes))
+
+
+class WM_OT_theme_editor_dump_profile(bpy.types.Operator):
+    bl_idname = "wm.theme_editor_dump_profile"
+    bl_label = "Save Profiling Trace"
+    bl_description = "Save the profiling stats and trace as JSON, or only the trace as CSV"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.json;*.csv", options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, context):
+        return profiling.enabled
+
+    def execute(self, context):
+        try:
+            profiling.dump(self.filepath)
+        except OSError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Saved " + self.filepath)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.filepath = "theme_editor_profile.json"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+class WM_OT_theme_editor_reset_profile(bpy.types.Operator):
+    bl_idname = "wm.theme_editor_reset_profile"
+    bl_label = "Reset Profiling"
+    bl_description = "Clear the profiling stats and trace"
+
+    @classmethod
+    def poll(cls, context):
+        return profiling.enabled
+
+    def execute(self, context):
+        profiling.reset()
+        return {'FINISHED'}
 
 
 class WM_OT_build_theme_colors(bpy.types.Operator):
@@ -602,31 +1886,77 @@ Useful when the you assign the same color to several groups or change individual
         return bool(context.window_manager)
 
     def execute(self, context):
-        build_color_list()
+        request_rebuild()
         return {'FINISHED'}
 
 
+# The HSV + Contrast and LUT dialogs edit a snapshot of the listed properties taken at invoke.
+# Slider changes only schedule the edit, it's applied once per frame by a timer.
+# indices are the properties, groups the position of their group in colors
+EditBase = namedtuple('EditBase', ['indices', 'groups', 'colors'])
+edit_base = None
+edit_pending = None
+
+
+def get_edit_base(theme_edit):
+    members = [color_paths(group) for group in range(len(ordered_colors))]
+    groups = np.repeat(np.arange(len(members)), [len(group) for group in members])
+    indices = np.concatenate(members).astype(int) if members else np.empty(0, dtype=int)
+    return EditBase(indices, groups, get_group_colors(theme_edit.color_groups))
+
+
+@profiling.profiled("apply_edit_preview")
+def apply_edit_preview(transform):
+    """Write the snapshot colors edited by transform, a function of an N x 3 RGB array.
+    Only the properties whose color changed are written"""
+    global edit_pending
+    edit_pending = None
+    if edit_base is None:
+        return
+    group_colors = edit_base.colors.copy()
+    group_colors[:, 0:3] = transform(edit_base.colors[:, 0:3])
+    write_color_table(edit_base.indices, group_colors[edit_base.groups])
+
+
+def request_edit_preview(transform):
+    global edit_pending
+    edit_pending = transform
+    if bpy.app.background:
+        apply_edit_preview(edit_pending)
+    elif not bpy.app.timers.is_registered(flush_edit_preview):
+        bpy.app.timers.register(flush_edit_preview, first_interval=0.0)
+
+
+def cancel_edit_preview():
+    """Write the snapshot colors back"""
+    global edit_base
+    global edit_pending
+    edit_pending = None
+    if edit_base is not None:
+        write_color_table(edit_base.indices, edit_base.colors[edit_base.groups])
+    edit_base = None
+
+
+@profiling.profiled("flush_edit_preview")
+def flush_edit_preview():
+    if edit_pending is not None:
+        apply_edit_preview(edit_pending)
+    return None
+
+
 class WM_OT_edit_theme_colors(bpy.types.Operator):
     bl_idname = "wm.edit_theme_colors"
     bl_label = "Edit HSV + Contrast"
     bl_description = "Edit all colors at the same time, taking name and color filters into account"
 
+    @profiling.profiled_update("WM_OT_edit_theme_colors.run_implementation")
     def run_implementation(self, context):
-        theme_edit = context.window_manager.theme_edit
-        for group in theme_edit.color_groups:
-            color = mathutils.Color(group.color[0:3])
-            color.h += self.hue * 0.5
-            if color.s > 0:
-                color.s += self.saturation * 0.5
-            color.v += self.value * 0.5
+        request_edit_preview(self.transform())
 
-            contrast_scalar = self.contrast + 1.0
-            color.r = (color.r - 0.5) * contrast_scalar + 0.5
-            color.g = (color.g - 0.5) * contrast_scalar + 0.5
-            color.b = (color.b - 0.5) * contrast_scalar + 0.5
-
-            set_color_group(
-                group.index, (color.r, color.g, color.b, group.color[3]))
+    def transform(self):
+        # the timer must not read the operator, so the edit is bound to the current values
+        return functools.partial(color_math.hsv_contrast, hue=self.hue, saturation=self.saturation,
+                                 value=self.value, contrast=self.contrast)
 
     hue: bpy.props.FloatProperty(
         name="Hue", min=-1, max=1, update=run_implementation)
@@ -642,27 +1972,164 @@ class WM_OT_edit_theme_colors(bpy.types.Operator):
         return bool(context.window_manager)
 
     def execute(self, context):
-        self.run_implementation(context)
-        build_color_list()
+        global edit_base
+        if edit_base is None:
+            edit_base = get_edit_base(context.window_manager.theme_edit)
+        apply_edit_preview(self.transform())
+        edit_base = None
+        build_color_list(STAGE_GROUP)
         push_undo_step()
         return {'FINISHED'}
 
     def invoke(self, context, event):
+        global edit_base
+        edit_base = None
         self.hue = 0
         self.saturation = 0
         self.value = 0
         self.contrast = 0
+        edit_base = get_edit_base(context.window_manager.theme_edit)
 
         wm = context.window_manager
         return wm.invoke_props_dialog(self)
 
     def cancel(self, context):
-        self.hue = 0
-        self.saturation = 0
-        self.value = 0
-        self.contrast = 0
+        cancel_edit_preview()
+
+
+# Parsed LUTs by absolute filepath, as (mtime_ns, size, CubeLUT or None, error message)
+LUT_CACHE_SIZE = 4
+lut_cache = {}
+
+
+def get_lut(filepath):
+    """The parsed .cube LUT at filepath and the reason it can't be read, if it can't.
+    The LUT is only parsed again when the file changes"""
+    if not filepath:
+        return None, ""
+    filepath = bpy.path.abspath(filepath)
+    try:
+        stat = os.stat(filepath)
+    except OSError as error:
+        return None, error.strerror or str(error)
+    entry = lut_cache.get(filepath)
+    if entry is None or entry[0:2] != (stat.st_mtime_ns, stat.st_size):
+        lut = None
+        error = ""
+        try:
+            lut = cube_lut.read_cube_lut(filepath)
+        except (OSError, ValueError) as exception:
+            error = str(exception)
+        lut_cache.pop(filepath, None)
+        while len(lut_cache) >= LUT_CACHE_SIZE:
+            del lut_cache[next(iter(lut_cache))]
+        entry = lut_cache[filepath] = (stat.st_mtime_ns, stat.st_size, lut, error)
+    return entry[2], entry[3]
+
+
+class WM_OT_apply_theme_lut(bpy.types.Operator):
+    bl_idname = "wm.apply_theme_lut"
+    bl_label = "Apply LUT"
+    bl_description = "Grade all colors with a .cube 3D or 1D LUT, taking name and color filters into account"
+
+    @profiling.profiled_update("WM_OT_apply_theme_lut.run_implementation")
+    def run_implementation(self, context):
+        request_edit_preview(self.transform())
+
+    def transform(self):
+        lut, error = get_lut(self.filepath)
+        if lut is None:
+            return lambda rgb: rgb
+        return functools.partial(cube_lut.apply_lut, lut, strength=self.strength)
+
+    filepath: bpy.props.StringProperty(name="LUT", description="The .cube file to apply",
+                                       subtype='FILE_PATH', update=run_implementation)
+    strength: bpy.props.FloatProperty(name="Strength", description="Mix between the original and the graded colors",
+                                      default=1.0, min=0.0, max=1.0, subtype='FACTOR', update=run_implementation)
+
+    @classmethod
+    def poll(cls, context):
+        return bool(context.window_manager)
+
+    def execute(self, context):
+        global edit_base
+        if get_lut(self.filepath)[0] is None:
+            cancel_edit_preview()
+            self.report({'ERROR'}, "Can't read the LUT")
+            return {'CANCELLED'}
+        if edit_base is None:
+            edit_base = get_edit_base(context.window_manager.theme_edit)
+        apply_edit_preview(self.transform())
+        edit_base = None
+        build_color_list(STAGE_GROUP)
+        push_undo_step()
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        global edit_base
+        edit_base = get_edit_base(context.window_manager.theme_edit)
         self.run_implementation(context)
 
+        wm = context.window_manager
+        return wm.invoke_props_dialog(self)
+
+    def cancel(self, context):
+        cancel_edit_preview()
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'filepath')
+        layout.prop(self, 'strength')
+        lut, error = get_lut(self.filepath)
+        if error:
+            layout.label(text=error, icon='ERROR')
+        elif lut is not None:
+            layout.label(text="{} {}D LUT, size {}".format(lut.title, lut.dimensions, lut.size).strip())
+
+
+MergeIndex = namedtuple(
+    'MergeIndex', ['colors', 'order', 'properties', 'groups', 'names', 'name_groups'])
+merge_index = None
+# target group of each property in the current Merge Similar Colors preview
+merge_preview = None
+
+
+def get_merge_index():
+    """The visible properties flattened in list order, with their group position in the list
+    and interned property_name, and the sorted group positions that contain each name"""
+    global merge_index
+    if merge_index is None or merge_index.colors is not colors:
+        properties = []
+        groups = []
+        names = []
+        name_ids = {}
+        name_groups = []
+        for i, group in enumerate(sorted_groups):
+            for index in colors[ordered_colors[group]].tolist():
+                name = name_ids.setdefault(property_name(index), len(name_ids))
+                if name == len(name_groups):
+                    name_groups.append([])
+                if not name_groups[name] or name_groups[name][-1] != i:
+                    name_groups[name].append(i)
+                properties.append(index)
+                groups.append(i)
+                names.append(name)
+        merge_index = MergeIndex(colors, sorted_groups, properties, np.array(groups, dtype=int),
+                                 names, name_groups)
+    return merge_index
+
+
+def set_merge_preview(targets, group_colors):
+    """Recolor each property with the color of its target group,
+    only writing the properties whose target changed since the last preview"""
+    global merge_preview
+    groups = merge_index.groups
+    if merge_preview is None or len(merge_preview) != len(targets):
+        merge_preview = groups
+    write_colors((merge_index.properties[i], group_colors[targets[i]])
+                 for i in np.flatnonzero(targets != merge_preview))
+    merge_preview = targets
+
 
 class WM_OT_merge_similar_theme_colors(bpy.types.Operator):
     bl_idname = "wm.merge_similar_theme_colors"
@@ -671,38 +2138,27 @@ class WM_OT_merge_similar_theme_colors(bpy.types.Operator):
 Merge priority is determined by list order, so if color groups are ordered by user count, 
 the ones with lower user counts are merged into the ones with higher user counts"""
 
+    @profiling.profiled_update("WM_OT_merge_similar_theme_colors.run_implementation")
     def run_implementation(self, context):
         theme_edit = context.window_manager.theme_edit
-        self.merged_groups = 0
-        for i, group in reversed(list(enumerate(theme_edit.color_groups))):
-            hsv1 = mathutils.Color(group.color[0:3])
-            merged = False
-            for i2, group2 in enumerate(theme_edit.color_groups):
-                # if i == i2:
-                #    continue
-                hsv2 = mathutils.Color(group2.color[0:3])
-                match = True
-                if (math.isclose(hsv1.h, hsv2.h, abs_tol=self.h) == False or
-                    math.isclose(hsv1.s, hsv2.s, abs_tol=self.s) == False or
-                    math.isclose(hsv1.v, hsv2.v, abs_tol=self.v) == False or
-                        math.isclose(group.color[3], group2.color[3], abs_tol=self.a) == False):
-                    match = False
-                    continue
-                if match:
-                    if i != i2:
-                        merged = True
-                    if self.only_name_matches and merged:
-                        merged = False
-                        for prop1 in color_paths(group.index):
-                            for prop2 in color_paths(group2.index):
-                                if prop1.key == prop2.key:
-                                    if prop1.path.split('::')[1:] == prop2.path.split('::')[1:]:
-                                        merged = True
-                                        set_color(prop2, group.color)
-                    else:
-                        set_color_group(group2.index, group.color)
-            if merged:
-                self.merged_groups += 1
+        merge_index = get_merge_index()
+        group_colors = get_group_colors(
+            theme_edit.color_groups)[merge_index.order]
+        hsva = np.empty(group_colors.shape, dtype=np.float32)
+        hsva[:, 0:3] = color_math.rgb_to_hsv(group_colors[:, 0:3])
+        hsva[:, 3] = group_colors[:, 3]
+        # Every property takes the color of the first similar group in list order,
+        # with only_name_matches that group also needs a property with the same name
+        if self.only_name_matches:
+            targets, merged = color_math.merge_similar(
+                hsva, (self.h, self.s, self.v, self.a), merge_index.groups,
+                merge_index.names, merge_index.name_groups)
+        else:
+            targets, merged = color_math.merge_similar(
+                hsva, (self.h, self.s, self.v, self.a), merge_index.groups)
+
+        set_merge_preview(targets, group_colors)
+        self.merged_groups = np.count_nonzero(merged)
 
     # tolerance : bpy.props.FloatProperty(name="Tolerance", default=0.015, update=run_implementation)
     only_name_matches: bpy.props.BoolProperty(name="Only Name Matches",
@@ -723,23 +2179,27 @@ the ones with lower user counts are merged into the ones with higher user counts
 
     def execute(self, context):
         self.run_implementation(context)
-        build_color_list()
+        global merge_preview
+        merge_preview = None
+        build_color_list(STAGE_GROUP)
         push_undo_step()
         return {'FINISHED'}
 
     def invoke(self, context, event):
+        global merge_preview
+        merge_preview = None
         self.merged_groups = 0
         self.run_implementation(context)
         wm = context.window_manager
         return wm.invoke_props_dialog(self)
 
     def cancel(self, context):
-        self.only_name_matches = False
-        self.h = 0
-        self.s = 0
-        self.v = 0
-        self.a = 0
-        self.run_implementation(context)
+        global merge_preview
+        merge_index = get_merge_index()
+        group_colors = get_group_colors(
+            context.window_manager.theme_edit.color_groups)[merge_index.order]
+        set_merge_preview(merge_index.groups, group_colors)
+        merge_preview = None
 
     def draw(self, context):
         layout = self.layout
@@ -751,31 +2211,138 @@ the ones with lower user counts are merged into the ones with higher user counts
         layout.label(text=str(self.merged_groups) + " group(s) will be merged")
 
 
+# Reduce Palette clusters the listed groups in OKLab. The group points are cached for the
+# merge index they were computed for, and each run starts from the previous run centers,
+# so changing the color count only moves a few clusters
+ReduceCache = namedtuple('ReduceCache', ['merge_index', 'points', 'weights'])
+reduce_cache = None
+reduce_centers = None
+
+
+def get_reduce_cache(group_colors):
+    """The OKLab + alpha point and the property count of each listed group"""
+    global reduce_cache
+    global reduce_centers
+    merge_index = get_merge_index()
+    if reduce_cache is None or reduce_cache.merge_index is not merge_index:
+        points = np.empty((len(group_colors), 4), dtype=np.float32)
+        points[:, 0:3] = color_math.rgb_to_oklab(group_colors[:, 0:3])
+        points[:, 3] = group_colors[:, 3]
+        weights = np.bincount(merge_index.groups, minlength=len(group_colors))
+        reduce_cache = ReduceCache(merge_index, points, weights)
+        reduce_centers = None
+    return reduce_cache
+
+
+class WM_OT_reduce_theme_colors(bpy.types.Operator):
+    bl_idname = "wm.reduce_theme_colors"
+    bl_label = "Reduce Palette"
+    bl_description = """Cluster the color groups into the specified number of colors by perceptual similarity, taking name and color filters into account.
+Clusters are weighted by user count, and each cluster takes the color of its group with the most users"""
+
+    @profiling.profiled_update("WM_OT_reduce_theme_colors.run_implementation")
+    def run_implementation(self, context):
+        global reduce_centers
+        theme_edit = context.window_manager.theme_edit
+        merge_index = get_merge_index()
+        group_colors = get_group_colors(
+            theme_edit.color_groups)[merge_index.order]
+        cache = get_reduce_cache(group_colors)
+        labels, reduce_centers = color_math.kmeans(
+            cache.points, cache.weights, self.count, reduce_centers)
+        targets = color_math.cluster_representatives(labels, cache.weights)
+
+        set_merge_preview(targets[merge_index.groups], group_colors)
+        self.merged_groups = np.count_nonzero(targets != np.arange(len(targets)))
+
+    count: bpy.props.IntProperty(name="Colors", description="Number of colors to reduce the listed color groups to",
+                                 default=16, min=1, soft_max=64, max=1024, update=run_implementation)
+    merged_groups: bpy.props.IntProperty(name="Merged Groups", default=0)
+
+    @classmethod
+    def poll(cls, context):
+        return bool(context.window_manager)
+
+    def execute(self, context):
+        self.run_implementation(context)
+        global merge_preview
+        merge_preview = None
+        build_color_list(STAGE_GROUP)
+        push_undo_step()
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        global merge_preview
+        global reduce_centers
+        merge_preview = None
+        reduce_centers = None
+        self.merged_groups = 0
+        self.run_implementation(context)
+        wm = context.window_manager
+        return wm.invoke_props_dialog(self)
+
+    def cancel(self, context):
+        global merge_preview
+        merge_index = get_merge_index()
+        group_colors = get_group_colors(
+            context.window_manager.theme_edit.color_groups)[merge_index.order]
+        set_merge_preview(merge_index.groups, group_colors)
+        merge_preview = None
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'count')
+        layout.label(text=str(self.merged_groups) + " group(s) will be merged")
+
+
+class ThemeEditPreferences(bpy.types.AddonPreferences):
+    bl_idname = __name__
+
+    undo_memory: bpy.props.IntProperty(name="Undo Memory (MB)",
+                                       description="Maximum memory used by the undo history, the oldest steps are discarded when exceeded",
+                                       default=32, min=1, max=4096)
+
+    history_delay: bpy.props.FloatProperty(name="Recent Colors Delay",
+                                           description="Seconds without color changes before the last color is added to the recent colors and the undo history", default=0.5, min=0.05, max=5.0)
+
+    def profiling_callback(self, context):
+        profiling.enable(self.profiling)
+
+    profiling: bpy.props.BoolProperty(name="Profiling",
+                                      description="Record the calls, time and theme writes of the addon callbacks and operators, and show them in the Theme Editor panel", default=False, update=profiling_callback)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "undo_memory")
+        layout.prop(self, "history_delay")
+        layout.prop(self, "profiling")
+
+
 class ThemeEditPropertyGroup(bpy.types.PropertyGroup):
     filter_by_color: bpy.props.BoolProperty(name="Filter by Color",
-                                            description="Filter the color list by property color", update=build_color_list_callback)
+                                            description="Filter the color list by property color", update=filter_color_list_callback)
 
     color_filter: bpy.props.FloatVectorProperty(name="Color Filter",
-                                                size=4, subtype='COLOR_GAMMA', min=0.0, max=1.0, update=build_color_list_callback)
+                                                size=4, subtype='COLOR_GAMMA', min=0.0, max=1.0, update=filter_color_list_callback)
 
     color_filter_h: bpy.props.FloatProperty(name="Hue", description="Hue Tolerance",
-                                            default=0.0015, min=0.0015, max=1.0, update=build_color_list_callback)
+                                            default=0.0015, min=0.0015, max=1.0, update=filter_color_list_callback)
 
     color_filter_s: bpy.props.FloatProperty(name="Saturation", description="Saturation Tolerance",
-                                            default=0.0015, min=0.0015, max=1.0, update=build_color_list_callback)
+                                            default=0.0015, min=0.0015, max=1.0, update=filter_color_list_callback)
 
     color_filter_v: bpy.props.FloatProperty(name="Value", description="Value Tolerance",
-                                            default=0.0015, min=0.0015, max=1.0, update=build_color_list_callback)
+                                            default=0.0015, min=0.0015, max=1.0, update=filter_color_list_callback)
 
     filter_by_name: bpy.props.BoolProperty(name="Filter by Name",
-                                           description="Filter the color list by property name", update=build_color_list_callback)
+                                           description="Filter the color list by property name", update=filter_color_list_callback)
 
     name_filter: bpy.props.StringProperty(name='Name Filter',
                                           description="""Separate search tearms by commas, 
 precede optional search terms by '?' and filtered out search terms by '-'. 
 Letter case is ignored.
 Example: theme space, ? text, ? title, -highlight""",
-                                          update=build_color_list_callback)
+                                          update=filter_color_list_callback)
 
     highlight_selected: bpy.props.BoolProperty(name="Highlight Selected",
                                                description="Highlight the currently selected list items", update=highlight_selected_callback)
@@ -788,7 +2355,7 @@ Example: theme space, ? text, ? title, -highlight""",
 
     sort_type: bpy.props.EnumProperty(items=(('USERS', 'Sort color groups by user count', 'Sort color groups by user count'),
                                              ('COLOR', 'Sort color groups by color', 'Sort color groups by color')), default='USERS',
-                                      name="Sort color groups by", update=build_color_list_callback)
+                                      name="Sort color groups by", update=sort_color_list_callback)
 
     color_groups: bpy.props.CollectionProperty(type=ColorGroupProperties)
     group_index: bpy.props.IntProperty(
@@ -798,11 +2365,35 @@ Example: theme space, ? text, ? title, -highlight""",
         default=0, update=property_index_callback)
 
     sort_terms: bpy.props.StringProperty(name='Sort Paths by',
-                                         description="Show first on the path list the properties that matches this search terms",
-                                         update=sort_terms_callback)
+                                         description="Show first on the path list the properties that matches this search terms")
 
     history_palette: bpy.props.PointerProperty(type=bpy.types.Palette)
 
+    diff_type: bpy.props.EnumProperty(items=(('PRESET', 'Preset', 'Compare the theme with a preset'),
+                                             ('UNDO', 'Undo Steps', 'Compare the theme at two undo steps')), default='PRESET',
+                                      name="Compare")
+
+    diff_preset: bpy.props.EnumProperty(items=get_diff_preset_items, name="Preset",
+                                        description="Preset to compare the theme with")
+
+    diff_undo_from: bpy.props.IntProperty(name="From Undo Step",
+                                          description="Steps back in the undo history of the first theme, 0 is the latest one", default=1, min=0)
+
+    diff_undo_to: bpy.props.IntProperty(name="To Undo Step",
+                                        description="Steps back in the undo history of the second theme, 0 is the latest one", default=0, min=0)
+
+    diff_tolerance: bpy.props.FloatProperty(name="Tolerance",
+                                            description="Colors whose channels differ less than this are equal. Presets store 8 bit colors, so the default ignores their rounding", default=0.002, min=0.0, max=1.0, precision=4)
+
+    contrast_audit: bpy.props.BoolProperty(name="Contrast Audit",
+                                           description="Check the contrast of the text colors against their background colors while editing", update=contrast_audit_callback)
+
+    min_contrast: bpy.props.FloatProperty(name="Minimum Contrast",
+                                          description="Text colors with a lower WCAG contrast ratio are listed, 4.5 is the WCAG AA level for text", default=4.5, min=1.0, max=21.0)
+
+    diff_items: bpy.props.CollectionProperty(type=ThemeDiffItem)
+    diff_index: bpy.props.IntProperty(name="Difference Index")
+
 
 classes = [
     WM_OT_theme_editor_undo,
@@ -812,9 +2403,18 @@ classes = [
     VIEW_3D_UL_path_list,
     VIEW_3D_PT_theme_editor,
     WM_OT_build_theme_colors,
+    WM_OT_theme_editor_dump_profile,
+    WM_OT_theme_editor_reset_profile,
     WM_OT_edit_theme_colors,
+    WM_OT_apply_theme_lut,
     WM_OT_merge_similar_theme_colors,
+    WM_OT_reduce_theme_colors,
     ColorPathsPropertyGroup,
+    ThemeDiffItem,
+    VIEW_3D_UL_diff_list,
+    WM_OT_theme_editor_compare,
+    WM_OT_theme_editor_apply_diff,
+    ThemeEditPreferences,
     ThemeEditPropertyGroup,
     WM_OT_theme_edit_execute_preset,
     WM_OT_theme_edit_open_preset_folder,
@@ -830,10 +2430,28 @@ def register():
     bpy.types.WindowManager.theme_edit = bpy.props.PointerProperty(
         type=ThemeEditPropertyGroup)
 
-    build_color_list()
+    preferences = get_preferences()
+    profiling.enable(bool(preferences and preferences.profiling))
+
+    global last_theme
+    last_theme = THEME_EDIT_MT_Presets.bl_label
+    bpy.app.timers.register(functools.partial(request_rebuild, push_undo=True))
+    bpy.app.timers.register(check_theme_changes,
+                            first_interval=THEME_CHECK_INTERVAL, persistent=True)
 
 
 def unregister():
+    for timer in (check_theme_changes, process_rebuild, flush_highlight, flush_last_color,
+                  flush_edit_preview):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+
+    global preset_previews
+    if preset_previews is not None:
+        bpy.utils.previews.remove(preset_previews)
+        preset_previews = None
+        preset_preview_keys.clear()
+
     for _class in classes:
         bpy.utils.unregister_class(_class)
 
@@ -0,0 +1,165 @@
+"""Time the addon operations on synthetic themes, outside of Blender.
+
+    python benchmarks/benchmark.py --sizes 100 1000 5000 20000 --depth 3
+
+Every operation runs on a freshly registered addon, the reported time is the best of
+--repeat runs and the peak memory is the one traced by tracemalloc during an extra run."""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bpy_stub
+
+ADDON_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(size, depth, fanout):
+    bpy = bpy_stub.install(bpy_stub.make_theme(size, depth, fanout))
+    addon = bpy_stub.load_addon(ADDON_PATH)
+    addon.register()
+    bpy.app.timers.run()
+    return bpy, addon
+
+
+def bench_build(bpy, addon):
+    return lambda: addon.build_color_list()
+
+
+def bench_regroup(bpy, addon):
+    return lambda: addon.build_color_list(addon.STAGE_GROUP)
+
+
+def bench_filter(bpy, addon):
+    theme_edit = bpy.context.window_manager.theme_edit
+
+    def run():
+        theme_edit.filter_by_name = True
+        theme_edit.name_filter = "inner, ?text, -outline"
+    return run
+
+
+def bench_sort(bpy, addon):
+    theme_edit = bpy.context.window_manager.theme_edit
+    return lambda: setattr(theme_edit, "sort_type", 'COLOR')
+
+
+def bench_path_order(bpy, addon):
+    theme_edit = bpy.context.window_manager.theme_edit
+    index = int(addon.sorted_groups[0])
+    return lambda: addon.get_path_order(index, "inner, ?text")
+
+
+def bench_merge(bpy, addon):
+    context = bpy.context
+    operator = addon.WM_OT_merge_similar_theme_colors()
+
+    def run():
+        operator.invoke(context, None)
+        operator.h = operator.s = operator.v = 0.1
+        operator.execute(context)
+    return run
+
+
+def bench_edit(bpy, addon):
+    context = bpy.context
+    operator = addon.WM_OT_edit_theme_colors()
+
+    def run():
+        operator.invoke(context, None)
+        operator.hue = 0.2
+        operator.contrast = 0.3
+        operator.execute(context)
+    return run
+
+
+def bench_undo_step(bpy, addon):
+    theme_edit = bpy.context.window_manager.theme_edit
+    for group in addon.sorted_groups[:10]:
+        addon.set_color_group(int(group), (0.5, 0.25, 0.75, 1.0))
+    return lambda: addon.push_undo_step()
+
+
+def bench_compare_preset(bpy, addon):
+    context = bpy.context
+    theme_edit = context.window_manager.theme_edit
+    folder = bpy.utils.preset_paths("interface_theme")[0]
+    filepath = os.path.join(folder, "benchmark.xml")
+    bpy_stub.write_preset(context.preferences.themes[0], filepath)
+    for group in addon.sorted_groups[:10]:
+        addon.set_color_group(int(group), (0.5, 0.25, 0.75, 1.0))
+    theme_edit.diff_type = 'PRESET'
+    theme_edit.diff_preset = filepath
+    operator = addon.WM_OT_theme_editor_compare()
+
+    def run():
+        # the collection items share their paths, they must be left out instead of breaking the diff
+        assert operator.execute(context) == {'FINISHED'}
+        assert not any(path.startswith("bone_color_sets")
+                       for path in addon.get_preset_colors([filepath])[filepath].paths)
+    return run
+
+
+BENCHMARKS = {
+    "build_color_list": bench_build,
+    "regroup": bench_regroup,
+    "name_filter": bench_filter,
+    "sort_by_color": bench_sort,
+    "path_order": bench_path_order,
+    "merge_similar_colors": bench_merge,
+    "edit_hsv_contrast": bench_edit,
+    "push_undo_step": bench_undo_step,
+    "compare_preset": bench_compare_preset,
+}
+
+
+def measure(name, size, depth, fanout, repeat):
+    times = []
+    for i in range(repeat + 1):
+        bpy, addon = setup(size, depth, fanout)
+        run = BENCHMARKS[name](bpy, addon)
+        gc.collect()
+        if i == repeat:
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return min(times), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000],
+                        help="Color property counts of the synthetic themes")
+    parser.add_argument("--depth", type=int, default=3, help="Struct nesting depth")
+    parser.add_argument("--fanout", type=int, default=4, help="Nested structs per struct")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per operation")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+                        help="Run only these operations")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:<22}{:>8}{:>12}{:>12}".format("operation", "size", "time (ms)", "peak (KiB)"))
+    for size in args.sizes:
+        for name in args.only or BENCHMARKS:
+            seconds, peak = measure(name, size, args.depth, args.fanout, args.repeat)
+            results.append({"operation": name, "size": size, "depth": args.depth,
+                            "seconds": seconds, "peak_bytes": peak})
+            print("{:<22}{:>8}{:>12.2f}{:>12.1f}".format(name, size, seconds * 1000, peak / 1024))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
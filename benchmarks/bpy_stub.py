@@ -0,0 +1,592 @@
+"""Lightweight stand-in for the bpy, mathutils and bl_operators modules.
+It only implements what the addon needs to be imported and driven from plain CPython,
+with synthetic themes built from make_theme instead of Blender's UI theme."""
+import os
+import random
+import struct
+import sys
+import tempfile
+import types
+
+
+def f32(value):
+    """Round to single precision, like the values stored in Blender properties"""
+    return struct.unpack('f', struct.pack('f', float(value)))[0]
+
+
+def rgb_to_hsv(r, g, b):
+    k = 0.0
+    if g < b:
+        g, b = b, g
+        k = -1.0
+    min_gb = b
+    if r < g:
+        r, g = g, r
+        k = -2.0 / 6.0 - k
+        min_gb = min(g, b)
+    chroma = r - min_gb
+    h = abs(k + (g - b) / (6.0 * chroma + 1e-20))
+    s = chroma / (r + 1e-20)
+    return h, s, r
+
+
+def hsv_to_rgb(h, s, v):
+    nr = min(max(abs(h * 6.0 - 3.0) - 1.0, 0.0), 1.0)
+    ng = min(max(2.0 - abs(h * 6.0 - 2.0), 0.0), 1.0)
+    nb = min(max(2.0 - abs(h * 6.0 - 4.0), 0.0), 1.0)
+    return (((nr - 1.0) * s + 1.0) * v,
+            ((ng - 1.0) * s + 1.0) * v,
+            ((nb - 1.0) * s + 1.0) * v)
+
+
+class Color:
+    """mathutils.Color, the hsv setters clamp to 0..1 like Blender's"""
+    __slots__ = ('_rgb',)
+
+    def __init__(self, rgb=(0.0, 0.0, 0.0)):
+        rgb = tuple(rgb)
+        if len(rgb) != 3:
+            raise ValueError("Color(): expected 3 items")
+        self._rgb = [f32(x) for x in rgb]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._rgb)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._rgb[index])
+        return self._rgb[index]
+
+    def _channel(index):
+        def get(self):
+            return self._rgb[index]
+
+        def set(self, value):
+            self._rgb[index] = f32(value)
+        return property(get, set)
+
+    def _hsv_channel(index):
+        def get(self):
+            return f32(rgb_to_hsv(*self._rgb)[index])
+
+        def set(self, value):
+            hsv = list(rgb_to_hsv(*self._rgb))
+            hsv[index] = min(max(float(value), 0.0), 1.0)
+            self._rgb = [f32(x) for x in hsv_to_rgb(*hsv)]
+        return property(get, set)
+
+    r, g, b = _channel(0), _channel(1), _channel(2)
+    h, s, v = _hsv_channel(0), _hsv_channel(1), _hsv_channel(2)
+
+
+class bpy_prop_array(list):
+    pass
+
+
+# Properties
+
+class _PropertyDefinition:
+    def __init__(self, kind, options):
+        self.kind = kind
+        self.options = options
+
+
+def _check_callback(keyword, function, argument_count):
+    """Blender only accepts plain functions with the exact argument count as callbacks"""
+    if function is None:
+        return
+    if not isinstance(function, types.FunctionType):
+        raise TypeError("{} keyword: expected a function type, not a {}".format(
+            keyword, type(function).__name__))
+    if function.__code__.co_argcount != argument_count:
+        raise TypeError("{} keyword: expected a function taking {} arguments, not {}".format(
+            keyword, argument_count, function.__code__.co_argcount))
+
+
+# (min, max) argument counts of the methods Blender calls, with self or cls
+REGISTRABLE_METHODS = {
+    'Operator': {'poll': (2, 2), 'execute': (2, 2), 'invoke': (3, 3), 'modal': (3, 3),
+                 'draw': (2, 2), 'cancel': (2, 2), 'check': (2, 2)},
+    'Panel': {'poll': (2, 2), 'draw': (2, 2), 'draw_header': (2, 2), 'draw_header_preset': (2, 2)},
+    'Menu': {'poll': (2, 2), 'draw': (2, 2)},
+    'UIList': {'draw_item': (8, 10), 'draw_filter': (3, 3), 'filter_items': (4, 4)},
+}
+
+
+def _check_methods(cls):
+    """Like register_class, raise ValueError if a method Blender calls has the wrong argument count"""
+    base = next((base for base in cls.__mro__ if base.__module__ == __name__
+                 and base.__name__ in REGISTRABLE_METHODS), None)
+    if base is None:
+        return
+    for name, (min_count, max_count) in REGISTRABLE_METHODS[base.__name__].items():
+        method = getattr(cls, name, None)
+        if method is None:
+            continue
+        function = getattr(method, '__func__', method)
+        count = function.__code__.co_argcount
+        if not min_count <= count <= max_count:
+            raise ValueError("expected {} class \"{}\" function to have {} args, found {}".format(
+                base.__name__, cls.__name__, max_count, count))
+
+
+def _property_function(kind):
+    def definition(**options):
+        _check_callback("update", options.get('update'), 2)
+        return _PropertyDefinition(kind, options)
+    definition.__name__ = kind
+    return definition
+
+
+PROPERTY_KINDS = ['FloatProperty', 'IntProperty', 'BoolProperty', 'StringProperty',
+                  'EnumProperty', 'FloatVectorProperty', 'CollectionProperty', 'PointerProperty']
+
+
+class _Collection:
+    def __init__(self, item_type):
+        self._type = item_type
+        self._items = []
+
+    def add(self):
+        item = self._type()
+        self._items.append(item)
+        return item
+
+    def remove(self, index):
+        del self._items[index]
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def foreach_set(self, attribute, sequence):
+        # like in Blender, the property update callbacks are not called
+        sequence = list(sequence)
+        size = len(sequence) // max(len(self._items), 1)
+        for i, item in enumerate(self._items):
+            values = sequence[i * size:(i + 1) * size]
+            item.__dict__.setdefault('_properties', {})[attribute] = (
+                [f32(x) for x in values] if size > 1 else values[0])
+
+    def foreach_get(self, attribute, sequence):
+        values = []
+        for item in self._items:
+            value = getattr(item, attribute)
+            if isinstance(value, (list, tuple)):
+                values.extend(value)
+            else:
+                values.append(value)
+        sequence[:] = values
+
+
+class _Property:
+    def __init__(self, name, definition):
+        self.name = name
+        self.kind = definition.kind
+        self.options = definition.options
+
+    def default(self):
+        options = self.options
+        if self.kind == 'FloatVectorProperty':
+            size = options.get('size', 3)
+            return [f32(x) for x in options.get('default', (0.0,) * size)]
+        if self.kind == 'CollectionProperty':
+            return _Collection(options['type'])
+        if self.kind == 'PointerProperty':
+            if issubclass(options['type'], PropertyGroup):
+                return options['type']()
+            return None
+        if self.kind == 'EnumProperty':
+            return options.get('default', options['items'][0][0])
+        return options.get('default', {'FloatProperty': 0.0, 'IntProperty': 0,
+                                       'BoolProperty': False, 'StringProperty': ''}.get(self.kind))
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        properties = instance.__dict__.setdefault('_properties', {})
+        if self.name not in properties:
+            properties[self.name] = self.default()
+        value = properties[self.name]
+        if self.kind == 'FloatVectorProperty':
+            return bpy_prop_array(value)
+        return value
+
+    def __set__(self, instance, value):
+        options = self.options
+        if self.kind == 'CollectionProperty':
+            raise AttributeError("bpy_struct: attribute is read-only")
+        if self.kind == 'FloatVectorProperty':
+            value = list(value)
+            if len(value) != options.get('size', 3):
+                raise ValueError("sequences of dimension 0 should contain %d items"
+                                 % options.get('size', 3))
+            low, high = options.get('min', -1e30), options.get('max', 1e30)
+            value = [f32(min(max(float(x), low), high)) for x in value]
+        elif self.kind == 'FloatProperty':
+            low, high = options.get('min', -1e30), options.get('max', 1e30)
+            value = f32(min(max(float(value), low), high))
+        elif self.kind == 'IntProperty':
+            low, high = options.get('min', -2**31), options.get('max', 2**31)
+            value = int(min(max(int(value), low), high))
+        instance.__dict__.setdefault('_properties', {})[self.name] = value
+        update = options.get('update')
+        if update is not None:
+            update(instance, context)
+
+
+class _StructMeta(type):
+    def __setattr__(cls, name, value):
+        if isinstance(value, _PropertyDefinition):
+            value = _Property(name, value)
+        type.__setattr__(cls, name, value)
+
+
+# Types
+
+class bpy_struct(metaclass=_StructMeta):
+    pass
+
+
+class PropertyGroup(bpy_struct):
+    pass
+
+
+class Operator(bpy_struct):
+    def report(self, type, message):
+        self.__dict__.setdefault('reports', []).append((type, message))
+
+
+class Panel(bpy_struct):
+    pass
+
+
+class UIList(bpy_struct):
+    bitflag_filter_item = 1 << 30
+
+
+class Menu(bpy_struct):
+    bl_label = "Presets"
+
+    def draw_preset(self, context):
+        pass
+
+    def path_menu(self, *args, **kwargs):
+        pass
+
+
+class AddonPreferences(bpy_struct):
+    pass
+
+
+class WindowManager(bpy_struct):
+    windows = []
+
+    def invoke_props_dialog(self, operator, **kwargs):
+        return {'RUNNING_MODAL'}
+
+
+class PaletteColor(bpy_struct):
+    pass
+
+
+PaletteColor.color = _PropertyDefinition('FloatVectorProperty', {'size': 3, 'min': 0.0, 'max': 1.0})
+
+
+class _PaletteColors(_Collection):
+    def new(self):
+        return self.add()
+
+
+class Palette(bpy_struct):
+    def __init__(self, name=""):
+        self.name = name
+        self.colors = _PaletteColors(PaletteColor)
+
+
+class _Palettes(dict):
+    def new(self, name):
+        palette = Palette(name)
+        self[name] = palette
+        return palette
+
+
+class UI_UL_list:
+    @staticmethod
+    def sort_items_helper(sort_data, key, reverse=False):
+        neworder = [None] * len(sort_data)
+        for new, (old, _) in enumerate(sorted(sort_data, key=key, reverse=reverse)):
+            neworder[old] = new
+        return neworder
+
+
+class ImagePreview:
+    def __init__(self, icon_id):
+        self.icon_id = icon_id
+        self.icon_size = (0, 0)
+        self.icon_pixels = []
+
+
+class ImagePreviewCollection(dict):
+    def new(self, name):
+        self[name] = ImagePreview(len(self) + 1)
+        return self[name]
+
+
+# Synthetic themes
+
+class _RNAProperty:
+    __slots__ = ('identifier', 'name')
+
+    def __init__(self, identifier, name):
+        self.identifier = identifier
+        self.name = name
+
+
+class _RNA:
+    def __init__(self, properties):
+        self.properties = properties
+
+
+class ThemeStruct(bpy_struct):
+    """A theme struct with nested structs and float32 color values,
+    3 item colors are returned as Color and 4 item ones as bpy_prop_array"""
+
+    def __init__(self, children, values):
+        object.__setattr__(self, '_children', children)
+        object.__setattr__(self, '_values', values)
+        properties = {key: _RNAProperty(key, key.replace('_', ' ').title())
+                      for key in list(children) + list(values)}
+        object.__setattr__(self, 'bl_rna', _RNA(properties))
+        object.__setattr__(self, 'rna_type', None)
+
+    def __dir__(self):
+        return sorted(list(self._children) + list(self._values) + ['bl_rna', 'rna_type'])
+
+    def __getattr__(self, key):
+        children = object.__getattribute__(self, '_children')
+        if key in children:
+            return children[key]
+        values = object.__getattribute__(self, '_values')
+        if key in values:
+            value = values[key]
+            if isinstance(value, list):
+                return Color(value) if len(value) == 3 else bpy_prop_array(value)
+            return value
+        raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        values = self._values
+        if key not in values:
+            raise AttributeError(key)
+        if isinstance(values[key], list):
+            value = list(value)
+            if len(value) != len(values[key]):
+                raise ValueError("sequences of dimension 0 should contain %d items, not %d"
+                                 % (len(values[key]), len(value)))
+            value = [f32(min(max(float(x), 0.0), 1.0)) for x in value]
+        values[key] = value
+
+
+COLOR_KEYS = ['text', 'text_hi', 'back', 'inner', 'inner_sel', 'outline', 'header', 'item', 'title']
+
+
+def make_theme(color_count=1500, depth=3, fanout=4, palette_size=60, seed=1):
+    """Build a theme with color_count color properties spread over structs nested depth levels,
+    the colors are picked from a random palette so they form groups like a real theme does"""
+    rng = random.Random(seed)
+    palette = [[f32(round(rng.random() * 255) / 255) for channel in range(4)]
+               for color in range(palette_size)]
+    for color in palette[:palette_size // 3]:
+        color[3] = 1.0
+
+    struct_count = sum(fanout ** level for level in range(depth + 1))
+    per_struct = max(1, -(-color_count // struct_count))
+    remaining = [color_count]
+
+    def struct_values():
+        values = {}
+        for i in range(min(per_struct, remaining[0])):
+            color = list(rng.choice(palette))
+            if rng.random() < 0.5:
+                color = color[:3]
+            values["{}_{}".format(rng.choice(COLOR_KEYS), i)] = color
+        remaining[0] -= len(values)
+        values['roundness'] = 0.2
+        values['shadow'] = 3
+        return values
+
+    def build_struct(level):
+        children = {}
+        if level < depth:
+            for i in range(fanout):
+                children["{}_colors_{}".format(COLOR_KEYS[(level + i) % len(COLOR_KEYS)], i)] = \
+                    build_struct(level + 1)
+        return ThemeStruct(children, struct_values())
+
+    return build_struct(0)
+
+
+def write_preset(theme, filepath, collection_items=3):
+    """Save the theme colors as an interface theme preset, like rna_xml writes them. A
+    bone_color_sets collection is added after the theme colors, since the presets shipped
+    with Blender have collections whose items all repeat the same property names"""
+    def color_attributes(struct):
+        return "".join(' {}="#{}"'.format(key, "".join(
+            "{:02x}".format(int(round(channel * 255))) for channel in value))
+            for key, value in struct._values.items() if isinstance(value, list))
+
+    def write_struct(file, struct, tag, indent):
+        file.write("{}<{}{}>\n".format(indent, tag, color_attributes(struct)))
+        for key, child in struct._children.items():
+            file.write("{}  <{}>\n".format(indent, key))
+            write_struct(file, child, "ThemeStruct", indent + "    ")
+            file.write("{}  </{}>\n".format(indent, key))
+        if tag == "Theme":
+            file.write("{}  <bone_color_sets>\n".format(indent))
+            for i in range(collection_items):
+                file.write('{}    <ThemeBoneColorSet normal="#{:02x}0000" select="#00{:02x}00">\n'
+                           '{}    </ThemeBoneColorSet>\n'.format(indent, i * 16, i * 16, indent))
+            file.write("{}  </bone_color_sets>\n".format(indent))
+        file.write("{}</{}>\n".format(indent, tag))
+
+    with open(filepath, 'w') as file:
+        file.write("<bpy>\n")
+        write_struct(file, theme, "Theme", "  ")
+        file.write("</bpy>\n")
+
+
+# Modules
+
+class Timers:
+    """bpy.app.timers, the registered functions are only called by run and tick"""
+
+    def __init__(self):
+        self.pending = []
+        self.persistent = []
+
+    def register(self, function, first_interval=0.0, persistent=False):
+        (self.persistent if persistent else self.pending).append(function)
+
+    def is_registered(self, function):
+        return function in self.pending or function in self.persistent
+
+    def unregister(self, function):
+        for timers in (self.pending, self.persistent):
+            if function in timers:
+                timers.remove(function)
+
+    def run(self):
+        """Call the non persistent timers until all of them finished"""
+        while self.pending:
+            function = self.pending.pop(0)
+            if function() is not None:
+                self.pending.append(function)
+
+    def tick(self):
+        """Call the persistent timers once"""
+        for function in list(self.persistent):
+            function()
+
+
+class _Preferences:
+    def __init__(self, theme):
+        self.themes = [theme]
+        self.addons = {}
+
+
+context = types.SimpleNamespace()
+
+
+def install(theme):
+    """Register the stand-in modules in sys.modules, with theme as the UI theme"""
+    bpy = types.ModuleType('bpy')
+    bpy_types = types.ModuleType('bpy.types')
+    bpy_props = types.ModuleType('bpy.props')
+    bpy_utils = types.ModuleType('bpy.utils')
+    bpy_app = types.ModuleType('bpy.app')
+
+    for name in ['bpy_struct', 'PropertyGroup', 'Operator', 'Panel', 'UIList', 'Menu',
+                 'AddonPreferences', 'WindowManager', 'Palette', 'UI_UL_list']:
+        setattr(bpy_types, name, globals()[name])
+    for kind in PROPERTY_KINDS:
+        setattr(bpy_props, kind, _property_function(kind))
+
+    def register_class(cls):
+        _check_methods(cls)
+        for name, annotation in list(getattr(cls, '__annotations__', {}).items()):
+            if isinstance(annotation, _PropertyDefinition):
+                type.__setattr__(cls, name, _Property(name, annotation))
+        setattr(bpy_types, cls.__name__, cls)
+
+    def unregister_class(cls):
+        if hasattr(bpy_types, cls.__name__):
+            delattr(bpy_types, cls.__name__)
+
+    resources = tempfile.mkdtemp(prefix="theme_editor_benchmark_")
+
+    def user_resource(resource_type, path="", create=False):
+        path = os.path.join(resources, resource_type, path)
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    bpy_utils.register_class = register_class
+    bpy_utils.unregister_class = unregister_class
+    bpy_utils.user_resource = user_resource
+    bpy_previews = types.ModuleType('bpy.utils.previews')
+    bpy_previews.new = ImagePreviewCollection
+    bpy_previews.remove = ImagePreviewCollection.clear
+    bpy_utils.previews = bpy_previews
+    bpy_utils.preset_paths = lambda subdir: [
+        user_resource('SCRIPTS', os.path.join("presets", subdir), create=True)]
+    bpy_app.timers = Timers()
+    bpy_app.version = (5, 0, 0)
+    bpy_app.background = True
+    bpy.types = bpy_types
+    bpy.props = bpy_props
+    bpy.utils = bpy_utils
+    bpy.app = bpy_app
+    bpy.ops = types.SimpleNamespace()
+    bpy.data = types.SimpleNamespace(palettes=_Palettes())
+
+    context.preferences = _Preferences(theme)
+    context.window_manager = WindowManager()
+    bpy.context = context
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Color = Color
+    bl_operators = types.ModuleType('bl_operators')
+    presets = types.ModuleType('bl_operators.presets')
+    presets.AddPresetBase = type('AddPresetBase', (), {})
+    bl_operators.presets = presets
+
+    sys.modules.update({'bpy': bpy, 'bpy.types': bpy_types, 'bpy.props': bpy_props,
+                        'bpy.utils': bpy_utils, 'bpy.app': bpy_app, 'bpy.utils.previews': bpy_previews, 'mathutils': mathutils,
+                        'bl_operators': bl_operators, 'bl_operators.presets': presets})
+    return bpy
+
+
+def load_addon(path, name="theme_editor"):
+    """Import the addon package at path, replacing a previously loaded one"""
+    import importlib.util
+    for module in [module for module in sys.modules if module == name or
+                   module.startswith(name + ".")]:
+        del sys.modules[module]
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(path, "__init__.py"), submodule_search_locations=[path])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[name] = addon
+    spec.loader.exec_module(addon)
+    return addon
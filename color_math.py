@@ -0,0 +1,284 @@
+import itertools
+import numpy as np
+
+# Vectorized versions of the color conversions used by mathutils.Color,
+# they work on arrays of any shape with the color channels in the last axis.
+# theme_batch.py imports it outside of Blender, so it doesn't use bpy.
+
+
+def rgb_to_hsv(rgb):
+    rgb = np.asarray(rgb, dtype=np.float32)
+    r = rgb[..., 0]
+    g = rgb[..., 1]
+    b = rgb[..., 2]
+
+    # Same algorithm as Blender's rgb_to_hsv, so results match mathutils.Color
+    swap = g < b
+    g, b = np.where(swap, b, g), np.where(swap, g, b)
+    k = np.where(swap, np.float32(-1.0), np.float32(0.0))
+    min_gb = b
+    swap = r < g
+    r, g = np.where(swap, g, r), np.where(swap, r, g)
+    k = np.where(swap, np.float32(-2.0 / 6.0) - k, k)
+    min_gb = np.where(swap, np.minimum(g, b), min_gb)
+
+    chroma = r - min_gb
+    hsv = np.empty(rgb.shape[:-1] + (3,), dtype=np.float32)
+    hsv[..., 0] = np.abs(k + (g - b) / (np.float32(6.0) * chroma + np.float32(1e-20)))
+    hsv[..., 1] = chroma / (r + np.float32(1e-20))
+    hsv[..., 2] = r
+    return hsv
+
+
+def hsv_to_rgb(hsv):
+    hsv = np.asarray(hsv, dtype=np.float32)
+    h = hsv[..., 0] * np.float32(6.0)
+    s = hsv[..., 1, None]
+    v = hsv[..., 2, None]
+
+    n = np.empty(hsv.shape[:-1] + (3,), dtype=np.float32)
+    n[..., 0] = np.abs(h - np.float32(3.0)) - np.float32(1.0)
+    n[..., 1] = np.float32(2.0) - np.abs(h - np.float32(2.0))
+    n[..., 2] = np.float32(2.0) - np.abs(h - np.float32(4.0))
+    np.clip(n, 0.0, 1.0, out=n)
+    return ((n - np.float32(1.0)) * s + np.float32(1.0)) * v
+
+
+def within_tolerance(values, target, tolerance):
+    """Per row test of abs(values - target) <= tolerance for all channels,
+    the vectorized equivalent of math.isclose(a, b, abs_tol=tolerance)"""
+    difference = np.abs(np.asarray(values, dtype=np.float64) -
+                        np.asarray(target, dtype=np.float64))
+    return np.all(difference <= np.asarray(tolerance, dtype=np.float64), axis=-1)
+
+
+def tolerance_neighbors(values, tolerance):
+    """Find every pair of rows that are within tolerance of each other on all channels.
+    Rows are bucketed in a grid with the tolerance as cell size,
+    so each row is only compared against the rows in its adjacent cells.
+    Returns two index arrays (rows, neighbors), sorted by row and then by neighbor.
+    Every row is its own neighbor."""
+    values = np.asarray(values, dtype=np.float64)
+    tolerance = np.asarray(tolerance, dtype=np.float64)
+    count, channels = values.shape
+    if count == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    cell_size = np.maximum(tolerance, 1e-9) * (1.0 + 1e-6)
+    cells = np.floor(values / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    size = int(cells.max()) + 2
+    weights = size ** np.arange(channels - 1, -1, -1, dtype=np.int64)
+    keys = cells @ weights
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    rows = []
+    neighbors = []
+    for offset in itertools.product((-1, 0, 1), repeat=channels):
+        neighbor_keys = keys + np.dot(offset, weights)
+        start = np.searchsorted(sorted_keys, neighbor_keys, 'left')
+        counts = np.searchsorted(sorted_keys, neighbor_keys, 'right') - start
+        total = counts.sum()
+        if total == 0:
+            continue
+        offsets = np.cumsum(counts) - counts
+        positions = (np.arange(total) - np.repeat(offsets, counts) +
+                     np.repeat(start, counts))
+        rows.append(np.repeat(np.arange(count), counts))
+        neighbors.append(order[positions])
+
+    rows = np.concatenate(rows)
+    neighbors = np.concatenate(neighbors)
+    close = within_tolerance(values[rows], values[neighbors], tolerance)
+    rows = rows[close]
+    neighbors = neighbors[close]
+    order = np.lexsort((neighbors, rows))
+    return rows[order], neighbors[order]
+
+
+def sort_groups(group_colors, counts, first, sort_type='USERS'):
+    """The order of the color groups in the list, descending by user count ('USERS') or
+    by saturated first, hue, saturation and value ('COLOR'), ties keep the theme order.
+    first is the theme position of the first property of each group"""
+    if sort_type == 'USERS':
+        return np.lexsort((first, -counts))
+    hsv = rgb_to_hsv(group_colors[:, 0:3])
+    return np.lexsort((first, -hsv[:, 2], -hsv[:, 1], hsv[:, 0], hsv[:, 1] != 0))
+
+
+def merge_similar(hsva, tolerance, groups, names=None, name_groups=None):
+    """Merge the color groups that are within tolerance of each other.
+    hsva holds the group colors in merge priority order and groups the group of each property.
+    Every property takes the color of the first similar group, with names (the name id of each
+    property) and name_groups (the sorted groups with each name) that group also needs
+    a property with the same name.
+    Returns the target group of each property and which groups were merged."""
+    rows, neighbors = tolerance_neighbors(hsva, tolerance)
+    count = len(hsva)
+    if names is not None:
+        neighbor_sets = [set(group_neighbors) for group_neighbors in
+                         np.split(neighbors, np.cumsum(np.bincount(rows, minlength=count))[:-1])]
+        targets = np.array(groups, dtype=int)
+        merged = np.zeros(count, dtype=bool)
+        for i, (group, name) in enumerate(zip(groups, names)):
+            similar = neighbor_sets[group]
+            for group2 in name_groups[name]:
+                if group2 != group and group2 in similar:
+                    merged[group] = True
+                    if group2 < targets[i]:
+                        targets[i] = group2
+    else:
+        first = np.arange(count)
+        np.minimum.at(first, rows, neighbors)
+        targets = first[groups]
+        merged = np.bincount(rows, minlength=count) > 1
+    return targets, merged
+
+
+def hsv_contrast(rgb, hue=0.0, saturation=0.0, value=0.0, contrast=0.0):
+    """The HSV + Contrast edit, doing the same steps as on a mathutils.Color:
+    each HSV channel is set on its own and clamped to 0..1, saturation only changes
+    for colors that already have some, and contrast scales the RGB channels around 0.5"""
+    rgb = np.asarray(rgb, dtype=np.float32)
+    hsv = rgb_to_hsv(rgb)
+    hsv[..., 0] = np.clip(hsv[..., 0] + np.float32(hue * 0.5), 0.0, 1.0)
+    hsv = rgb_to_hsv(hsv_to_rgb(hsv))
+    saturated = hsv[..., 1] > 0
+    hsv[..., 1] = np.where(saturated, np.clip(hsv[..., 1] + np.float32(saturation * 0.5), 0.0, 1.0),
+                           hsv[..., 1])
+    hsv = rgb_to_hsv(hsv_to_rgb(hsv))
+    hsv[..., 2] = np.clip(hsv[..., 2] + np.float32(value * 0.5), 0.0, 1.0)
+    rgb = hsv_to_rgb(hsv)
+    return (rgb - np.float32(0.5)) * np.float32(contrast + 1.0) + np.float32(0.5)
+
+
+def srgb_to_linear(rgb):
+    """Linear RGB of sRGB colors, like the COLOR_GAMMA theme colors"""
+    rgb = np.clip(np.asarray(rgb, dtype=np.float32), 0.0, 1.0)
+    return np.where(rgb <= 0.04045, rgb / np.float32(12.92),
+                    ((rgb + np.float32(0.055)) / np.float32(1.055)) ** np.float32(2.4))
+
+
+def rgb_to_oklab(rgb):
+    """OKLab coordinates of sRGB colors"""
+    lms = srgb_to_linear(rgb) @ np.array([[0.4122214708, 0.2119034982, 0.0883024619],
+                             [0.5363325363, 0.6806995451, 0.2817188376],
+                             [0.0514459929, 0.1073969566, 0.6299787005]], dtype=np.float32)
+    return np.cbrt(lms) @ np.array([[0.2104542553, 1.9779984951, 0.0259040371],
+                                    [0.7936177850, -2.4285922050, 0.7827717662],
+                                    [-0.0040720468, 0.4505937099, -0.8086757660]], dtype=np.float32)
+
+
+def kmeans(points, weights, count, centers=None, iterations=20):
+    """Weighted k-means of the points into count clusters.
+    centers are the initial ones, like the result of a previous run with another count,
+    the ones with the least weight are dropped and new ones are added at the points
+    farthest from them. Returns the cluster of each point and the cluster centers,
+    sorted by descending cluster weight."""
+    points = np.asarray(points, dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float32)
+    count = min(count, len(points))
+    if count == 0:
+        return np.zeros(len(points), dtype=int), np.empty((0,) + points.shape[1:], dtype=np.float32)
+    if centers is None or len(centers) == 0:
+        centers = points[[np.argmax(weights)]]
+    centers = np.array(centers[0:count], dtype=np.float32)
+    distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+    while len(centers) < count:
+        new = np.argmax(weights * distances)
+        centers = np.vstack([centers, points[new]])
+        distances = np.minimum(distances, ((points - points[new]) ** 2).sum(axis=1))
+
+    labels = None
+    for iteration in range(iterations):
+        new_labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        cluster_weights = np.bincount(labels, weights, minlength=count)
+        filled = cluster_weights > 0
+        for channel in range(points.shape[1]):
+            sums = np.bincount(labels, weights * points[:, channel], minlength=count)
+            centers[filled, channel] = sums[filled] / cluster_weights[filled]
+
+    order = np.argsort(-np.bincount(labels, weights, minlength=count), kind='stable')
+    positions = np.empty(count, dtype=int)
+    positions[order] = np.arange(count)
+    return positions[labels], centers[order]
+
+
+def cluster_representatives(labels, weights):
+    """The point with the most weight of each point cluster, ties go to the first one"""
+    order = np.lexsort((np.arange(len(labels)), -np.asarray(weights), labels))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    representatives = np.zeros(labels.max() + 1 if len(labels) else 0, dtype=int)
+    representatives[labels[order][first]] = order[first]
+    return representatives[labels]
+
+
+def relative_luminance(rgb):
+    """WCAG relative luminance of sRGB colors"""
+    return srgb_to_linear(rgb) @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def contrast_ratio(foreground, background):
+    """WCAG contrast ratio (1 to 21) of RGBA foreground colors drawn over RGB(A) backgrounds,
+    the foreground alpha blends it with the background"""
+    foreground = np.asarray(foreground, dtype=np.float32)
+    background = np.asarray(background, dtype=np.float32)
+    alpha = foreground[..., 3:4]
+    blended = foreground[..., 0:3] * alpha + background[..., 0:3] * (np.float32(1.0) - alpha)
+    luminance = relative_luminance(blended)
+    background_luminance = relative_luminance(background[..., 0:3])
+    return ((np.maximum(luminance, background_luminance) + np.float32(0.05)) /
+            (np.minimum(luminance, background_luminance) + np.float32(0.05)))
+
+
+HSV_GRID_CELLS = 16
+
+
+def within_hsv_tolerance(hsv, target, tolerance):
+    """within_tolerance for HSV colors, with the hue wrapping around"""
+    difference = np.abs(np.asarray(hsv, dtype=np.float64) - np.asarray(target, dtype=np.float64))
+    difference[..., 0] = np.minimum(difference[..., 0], 1.0 - difference[..., 0])
+    return np.all(difference <= np.asarray(tolerance, dtype=np.float64), axis=-1)
+
+
+def hsv_cells(hsv, cell_count=HSV_GRID_CELLS):
+    """The cell of each HSV color in a grid of cell_count cells per channel"""
+    coordinates = np.clip((np.asarray(hsv, dtype=np.float64) * cell_count).astype(int),
+                          0, cell_count - 1)
+    return (coordinates[..., 0] * cell_count + coordinates[..., 1]) * cell_count + coordinates[..., 2]
+
+
+def hsv_grid(cells, cell_count=HSV_GRID_CELLS):
+    """The rows sorted by cell, and the offset of each cell in that order"""
+    order = np.argsort(cells, kind='stable')
+    offsets = np.zeros(cell_count ** 3 + 1, dtype=int)
+    np.cumsum(np.bincount(cells, minlength=cell_count ** 3), out=offsets[1:])
+    return order, offsets
+
+
+def query_hsv_grid(hsv, order, offsets, target, tolerance, cell_count=HSV_GRID_CELLS):
+    """The rows of hsv within tolerance of target, with the hue wrapping around.
+    Only the rows in the grid cells that overlap the tolerance range are tested"""
+    target = np.asarray(target, dtype=np.float64)
+    tolerance = np.asarray(tolerance, dtype=np.float64)
+    low = np.floor((target - tolerance) * cell_count).astype(int)
+    high = np.floor((target + tolerance) * cell_count).astype(int)
+    if high[0] - low[0] + 1 >= cell_count:
+        hues = np.arange(cell_count)
+    else:
+        hues = np.unique(np.arange(low[0], high[0] + 1) % cell_count)
+    saturations = np.arange(max(low[1], 0), min(high[1], cell_count - 1) + 1)
+    values = np.arange(max(low[2], 0), min(high[2], cell_count - 1) + 1)
+
+    cells = ((hues[:, None, None] * cell_count + saturations[None, :, None]) * cell_count +
+             values[None, None, :]).reshape(-1)
+    starts = offsets[cells]
+    counts = offsets[cells + 1] - starts
+    positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    rows = order[positions]
+    return rows[within_hsv_tolerance(hsv[rows], target, tolerance)]
@@ -0,0 +1,85 @@
+from collections import namedtuple
+import numpy as np
+
+# Reader of .cube color lookup tables (the Resolve / Adobe format) and their vectorized
+# application to arrays of RGB colors.
+# Only the keywords needed to apply the table are read, the other ones are ignored.
+
+# table is size x 3 for 1D LUTs, and size x size x size x 3 indexed by [b, g, r] for 3D LUTs,
+# since red changes the fastest in the file
+CubeLUT = namedtuple('CubeLUT', ['title', 'size', 'dimensions', 'table', 'domain_min', 'domain_max'])
+
+
+def read_cube_lut(filepath):
+    """Parse a .cube file, raises ValueError if it isn't a valid LUT"""
+    title = ""
+    size = None
+    dimensions = 3
+    domain_min = [0.0, 0.0, 0.0]
+    domain_max = [1.0, 1.0, 1.0]
+    values = []
+    with open(filepath, encoding='utf-8', errors='replace') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            if line[0].isalpha():
+                keyword, _, argument = line.partition(' ')
+                argument = argument.strip()
+                if keyword == 'TITLE':
+                    title = argument.strip('"')
+                elif keyword in ('LUT_3D_SIZE', 'LUT_1D_SIZE'):
+                    size = int(argument)
+                    dimensions = 3 if keyword == 'LUT_3D_SIZE' else 1
+                elif keyword == 'DOMAIN_MIN':
+                    domain_min = [float(value) for value in argument.split()]
+                elif keyword == 'DOMAIN_MAX':
+                    domain_max = [float(value) for value in argument.split()]
+                continue
+            values.append(line)
+
+    if size is None or size < 2:
+        raise ValueError("Missing or invalid LUT size")
+    table = np.array(" ".join(values).split(), dtype=np.float32)
+    rows = size ** dimensions
+    if len(table) != rows * 3:
+        raise ValueError("Expected {} LUT entries, found {}".format(rows, len(table) // 3))
+    domain_min = np.array(domain_min, dtype=np.float32)
+    domain_max = np.array(domain_max, dtype=np.float32)
+    if domain_min.shape != (3,) or domain_max.shape != (3,) or np.any(domain_max <= domain_min):
+        raise ValueError("Invalid LUT domain")
+    table = table.reshape((size,) * dimensions + (3,))
+    return CubeLUT(title, size, dimensions, table, domain_min, domain_max)
+
+
+def apply_lut(lut, rgb, strength=1.0):
+    """The rgb colors through the LUT with linear (1D) or trilinear (3D) interpolation,
+    mixed with the original colors by strength"""
+    rgb = np.asarray(rgb, dtype=np.float32)
+    position = (rgb - lut.domain_min) / (lut.domain_max - lut.domain_min) * np.float32(lut.size - 1)
+    position = np.clip(position, 0.0, lut.size - 1)
+    low = np.minimum(position.astype(int), lut.size - 2)
+    fraction = position - low
+
+    if lut.dimensions == 1:
+        result = np.empty(rgb.shape, dtype=np.float32)
+        for channel in range(3):
+            lower = lut.table[low[..., channel], channel]
+            upper = lut.table[low[..., channel] + 1, channel]
+            result[..., channel] = lower + (upper - lower) * fraction[..., channel]
+    else:
+        r, g, b = low[..., 0], low[..., 1], low[..., 2]
+        fr, fg, fb = (fraction[..., channel, None] for channel in range(3))
+        table = lut.table
+        # interpolate along red, then green, then blue
+        c00 = table[b, g, r] + (table[b, g, r + 1] - table[b, g, r]) * fr
+        c01 = table[b + 1, g, r] + (table[b + 1, g, r + 1] - table[b + 1, g, r]) * fr
+        c10 = table[b, g + 1, r] + (table[b, g + 1, r + 1] - table[b, g + 1, r]) * fr
+        c11 = table[b + 1, g + 1, r] + (table[b + 1, g + 1, r + 1] - table[b + 1, g + 1, r]) * fr
+        c0 = c00 + (c10 - c00) * fg
+        c1 = c01 + (c11 - c01) * fg
+        result = c0 + (c1 - c0) * fb
+
+    if strength != 1.0:
+        result = rgb + (result - rgb) * np.float32(strength)
+    return result
@@ -0,0 +1,135 @@
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+import numpy as np
+
+# Streaming reader of the colors stored in interface theme presets, and an index of the preset
+# files that only parses them again when their modification time or size changes.
+# The hex color helpers are shared with the theme_batch.py command line tool.
+
+# The colors of a preset, by data path from the theme root ("user_interface.wcol_regular.inner"),
+# rgba holds 1.0 alpha for the 3 channel colors
+PresetColors = namedtuple('PresetColors', ['paths', 'rgba', 'sizes'])
+
+THEME_ELEMENT = "Theme"
+INDEX_VERSION = 2
+
+
+def parse_hex_color(value):
+    """The channels of a #rrggbb or #rrggbbaa preset value, None if it isn't a color"""
+    if value[0:1] != "#" or len(value) not in (7, 9):
+        return None
+    try:
+        return [int(value[i:i + 2], 16) / 255 for i in range(1, len(value), 2)]
+    except ValueError:
+        return None
+
+
+def format_hex_color(color):
+    return "#" + "".join("{:02x}".format(int(round(channel * 255))) for channel in color)
+
+
+def read_preset_colors(filepath):
+    """Stream the theme colors of a preset file, without building the XML tree.
+    The preset elements alternate between structs (<Theme>, <ThemeSpace>...)
+    and the properties that hold them (<view_3d>, <space>...). The items of collections
+    (<bone_color_sets>...) would all get the same path, so like the addon theme walk
+    the colors of properties holding more than one struct are skipped"""
+    paths = []
+    colors = []
+    sizes = []
+    # [tag, first color of the property, structs in the property] of the open properties
+    properties = []
+    depth = 0
+    in_theme = False
+    for event, element in ElementTree.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                in_theme = element.tag == THEME_ELEMENT
+            elif in_theme and depth % 2 == 1:
+                properties.append([element.tag, len(paths), 0])
+            if in_theme and depth % 2 == 0:
+                if properties:
+                    properties[-1][2] += 1
+                prefix = "".join(tag + "." for tag, start, structs in properties)
+                for key, value in element.attrib.items():
+                    color = parse_hex_color(value)
+                    if color is not None:
+                        paths.append(prefix + key)
+                        sizes.append(len(color))
+                        colors.append(color + [1.0] * (4 - len(color)))
+        else:
+            if in_theme and depth % 2 == 1 and depth > 2:
+                tag, start, structs = properties.pop()
+                if structs > 1:
+                    del paths[start:], sizes[start:], colors[start:]
+            depth -= 1
+            element.clear()
+    rgba = np.array(colors, dtype=np.float32).reshape(-1, 4)
+    return PresetColors(paths, rgba, np.array(sizes, dtype=np.int8))
+
+
+def load_preset_index(index_path):
+    """The saved preset index, an empty one if it's missing or from another version"""
+    try:
+        with open(index_path) as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        index = {}
+    if index.get("version") != INDEX_VERSION:
+        index = {"version": INDEX_VERSION, "presets": {}}
+    return index
+
+
+def save_preset_index(index, index_path):
+    try:
+        with open(index_path, 'w') as file:
+            json.dump(index, file)
+    except OSError:
+        pass
+
+
+def update_preset_index(index, filepaths):
+    """Read the colors of every preset file, only parsing the ones that changed since they
+    were indexed. Returns {filepath: PresetColors} and whether the index changed"""
+    presets = index["presets"]
+    changed = False
+    result = {}
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        entry = presets.get(filepath)
+        if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            try:
+                colors = read_preset_colors(filepath)
+            except (OSError, ElementTree.ParseError):
+                continue
+            entry = presets[filepath] = {
+                "mtime": stat.st_mtime_ns, "size": stat.st_size,
+                "paths": colors.paths, "rgba": colors.rgba.tolist(), "sizes": colors.sizes.tolist()}
+            changed = True
+        result[filepath] = PresetColors(entry["paths"],
+                                        np.array(entry["rgba"], dtype=np.float32).reshape(-1, 4),
+                                        np.array(entry["sizes"], dtype=np.int8))
+
+    for filepath in [filepath for filepath in presets if not os.path.exists(filepath)]:
+        del presets[filepath]
+        changed = True
+    return result, changed
+
+
+def find_presets(folders):
+    """The .xml files of the preset folders"""
+    filepaths = []
+    for folder in folders:
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError:
+            continue
+        filepaths.extend(os.path.join(folder, name) for name in names
+                         if name.lower().endswith(".xml"))
+    return filepaths
@@ -0,0 +1,133 @@
+import collections
+import csv
+import functools
+import json
+import time
+
+# Opt-in instrumentation of the addon entry points (property callbacks, operators and timers).
+# Each entry point records its call count, a wall time histogram and the theme writes done
+# while it runs, nested entry points are included in the ones that called them.
+# While disabled, the wrappers only check a flag before calling the wrapped function.
+
+# Upper bounds of the histogram buckets, in seconds
+HISTOGRAM_BOUNDS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+HISTOGRAM_LABELS = ("<0.1ms", "<1ms", "<10ms", "<100ms", "<1s", ">=1s")
+TRACE_LENGTH = 100000
+
+
+class EntryStats:
+    __slots__ = ('name', 'calls', 'seconds', 'max_seconds', 'writes', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.writes = 0
+        self.histogram = [0] * len(HISTOGRAM_LABELS)
+
+    def record(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        bucket = 0
+        while bucket < len(HISTOGRAM_BOUNDS) and seconds >= HISTOGRAM_BOUNDS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+
+TraceEvent = collections.namedtuple('TraceEvent', ['name', 'start', 'seconds', 'writes'])
+
+enabled = False
+stats = {}
+# Entry points being run, outermost first
+active = []
+trace = collections.deque(maxlen=TRACE_LENGTH)
+trace_start = time.perf_counter()
+
+
+def enable(value):
+    global enabled
+    enabled = value
+    active.clear()
+
+
+def reset():
+    global trace_start
+    stats.clear()
+    trace.clear()
+    trace_start = time.perf_counter()
+
+
+def record_call(name, function, *args, **kwargs):
+    """Run function, recording it as the name entry point while profiling is enabled"""
+    if not enabled:
+        return function(*args, **kwargs)
+    entry = stats.get(name)
+    if entry is None:
+        entry = stats[name] = EntryStats(name)
+    if entry in active:
+        # recursive calls are part of the outer one
+        return function(*args, **kwargs)
+
+    active.append(entry)
+    writes = entry.writes
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        active.remove(entry)
+        entry.record(seconds)
+        trace.append(TraceEvent(name, start - trace_start,
+                                seconds, entry.writes - writes))
+
+
+def profiled(name):
+    """Record the calls to the decorated function as the name entry point, while profiling is enabled"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return record_call(name, function, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_update(name):
+    """profiled for property update callbacks, bpy.props only accepts functions that
+    take exactly (self, context), so the wrapper keeps that signature"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, context):
+            return record_call(name, function, self, context)
+        return wrapper
+    return decorator
+
+
+def count_write(count=1):
+    for entry in active:
+        entry.writes += count
+
+
+def summary():
+    """The entry point stats, sorted by total time"""
+    return sorted(stats.values(), key=lambda entry: entry.seconds, reverse=True)
+
+
+def dump(filepath):
+    """Write the stats and the trace as JSON, or only the trace as CSV if filepath ends in .csv"""
+    if filepath.lower().endswith(".csv"):
+        with open(filepath, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(TraceEvent._fields)
+            writer.writerows(trace)
+        return
+
+    data = {
+        "histogram_labels": HISTOGRAM_LABELS,
+        "entry_points": [{slot: getattr(entry, slot) for slot in EntryStats.__slots__}
+                         for entry in summary()],
+        "trace": [event._asdict() for event in trace],
+    }
+    with open(filepath, 'w') as file:
+        json.dump(data, file, indent=1)
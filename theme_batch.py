@@ -0,0 +1,165 @@
+"""Apply the HSV + Contrast and Merge Similar Colors edits to interface theme preset files.
+
+    python theme_batch.py presets/interface_theme --hue 0.1 --contrast 0.2
+    blender --background --python theme_batch.py -- presets/interface_theme --merge 0.02
+
+The edited presets are written next to the originals, with --suffix added to their names.
+Merging runs before the HSV + Contrast edit, and both work like the addon operators with
+no filters, on every color of the preset."""
+import argparse
+import concurrent.futures
+import os
+import sys
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+
+try:
+    from . import color_math
+    from .preset_xml import parse_hex_color, format_hex_color
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import color_math
+    from preset_xml import parse_hex_color, format_hex_color
+
+
+def read_preset_colors(tree):
+    """The color attributes of a preset as (element, key, name) entries and their RGBA colors,
+    in document order. name is the attribute key and the path of the struct properties
+    below the top level one, like the addon property_name"""
+    entries = []
+    colors = []
+
+    def read_struct(element, path):
+        for key, value in element.attrib.items():
+            color = parse_hex_color(value)
+            if color is not None:
+                entries.append((element, key, (key, path[1:]), len(color)))
+                colors.append(color + [1.0] * (4 - len(color)))
+        for property_element in element:
+            for struct_element in property_element:
+                read_struct(struct_element, path + (property_element.tag,))
+
+    for struct_element in tree.getroot():
+        read_struct(struct_element, ())
+    return entries, np.array(colors, dtype=np.float32).reshape(-1, 4)
+
+
+def merge_colors(rgba, names, tolerance, only_name_matches=False, sort_type='USERS'):
+    """Merge Similar Colors on every color of a preset"""
+    group_colors, inverse, counts = np.unique(
+        rgba, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    first = np.full(len(group_colors), len(rgba))
+    np.minimum.at(first, inverse, np.arange(len(rgba)))
+    order = color_math.sort_groups(group_colors, counts, first, sort_type)
+    group_colors = group_colors[order]
+    positions = np.empty(len(order), dtype=int)
+    positions[order] = np.arange(len(order))
+    groups = positions[inverse]
+
+    hsva = np.empty(group_colors.shape, dtype=np.float32)
+    hsva[:, 0:3] = color_math.rgb_to_hsv(group_colors[:, 0:3])
+    hsva[:, 3] = group_colors[:, 3]
+    if only_name_matches:
+        name_ids = {}
+        name_groups = []
+        property_names = []
+        for name, group in zip(names, groups.tolist()):
+            name = name_ids.setdefault(name, len(name_ids))
+            if name == len(name_groups):
+                name_groups.append(set())
+            name_groups[name].add(group)
+            property_names.append(name)
+        name_groups = [sorted(name_group) for name_group in name_groups]
+        targets, merged = color_math.merge_similar(
+            hsva, tolerance, groups, property_names, name_groups)
+    else:
+        targets, merged = color_math.merge_similar(hsva, tolerance, groups)
+    return group_colors[targets]
+
+
+def output_path(path, suffix):
+    root, extension = os.path.splitext(path)
+    return root + suffix + extension
+
+
+def transform_preset(path, options):
+    """Edit the preset at path and write the result next to it, returns the written path"""
+    tree = ElementTree.parse(path)
+    entries, rgba = read_preset_colors(tree)
+    edited = rgba
+    if len(rgba) and options.merge is not None:
+        edited = merge_colors(rgba, [entry[2] for entry in entries], options.merge,
+                              options.only_name_matches, options.sort)
+    if len(rgba) and (options.hue or options.saturation or options.value or options.contrast):
+        edited = edited.copy()
+        edited[:, 0:3] = color_math.hsv_contrast(edited[:, 0:3], options.hue,
+                                                 options.saturation, options.value, options.contrast)
+    edited = np.clip(edited, 0.0, 1.0)
+
+    for (element, key, name, size), color in zip(entries, edited.tolist()):
+        element.set(key, format_hex_color(color[0:size]))
+    result = output_path(path, options.suffix)
+    with open(result, 'w', encoding='utf-8') as file:
+        tree.write(file, encoding='unicode')
+    return result
+
+
+def find_presets(paths, suffix):
+    presets = []
+    for path in paths:
+        if os.path.isdir(path):
+            presets.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                           if name.lower().endswith(".xml") and
+                           not os.path.splitext(name)[0].endswith(suffix))
+        else:
+            presets.append(path)
+    return presets
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="Preset files or folders of presets")
+    parser.add_argument("--hue", type=float, default=0.0)
+    parser.add_argument("--saturation", type=float, default=0.0)
+    parser.add_argument("--value", type=float, default=0.0)
+    parser.add_argument("--contrast", type=float, default=0.0)
+    parser.add_argument("--merge", type=float, nargs="+", metavar="TOLERANCE",
+                        help="Merge similar colors, with one tolerance for all the HSVA channels or one per channel")
+    parser.add_argument("--only-name-matches", action="store_true",
+                        help="Only merge colors into groups that have a property with the same name")
+    parser.add_argument("--sort", choices=('USERS', 'COLOR'), default='USERS',
+                        help="Color group order, which decides the merge priority")
+    parser.add_argument("--suffix", default="_edited", help="Added to the edited preset names")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Worker processes, 1 runs in this process")
+    options = parser.parse_args(argv)
+    for name in ("hue", "saturation", "value", "contrast"):
+        if not -1.0 <= getattr(options, name) <= 1.0:
+            parser.error("--{} must be between -1 and 1".format(name))
+    if options.merge is not None:
+        if len(options.merge) not in (1, 4):
+            parser.error("--merge takes 1 or 4 tolerances")
+        options.merge = tuple(options.merge * 4)[0:4]
+    return options
+
+
+def main(argv=None):
+    if argv is None:
+        # blender --background --python theme_batch.py -- <arguments>
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    options = parse_arguments(argv)
+    presets = find_presets(options.paths, options.suffix)
+
+    if options.jobs == 1 or len(presets) < 2:
+        results = [transform_preset(path, options) for path in presets]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(options.jobs) as executor:
+            results = list(executor.map(transform_preset, presets, [options] * len(presets)))
+    for result in results:
+        print(result)
+    return results
+
+
+if __name__ == "__main__":
+    main()
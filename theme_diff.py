@@ -0,0 +1,68 @@
+from collections import namedtuple
+import numpy as np
+
+# Comparison of two packed color tables (N x 4 RGBA rows with their data paths), like the
+# addon theme_rgba table, the colors of a preset or the theme at an undo level.
+# Paths missing from one table are reported as added or removed, so presets of other
+# Blender versions can be compared too.
+
+CHANGED = 0
+ADDED = 1
+REMOVED = 2
+KIND_NAMES = ("Changed", "Added", "Removed")
+
+# The differences from table a to table b. Each entry is a path with its row in both tables,
+# -1 if the table doesn't have it. Entries are grouped by kind and by their colors in both
+# tables, like the addon groups properties by color, most used groups first.
+# before / after are the group colors in a / b, the same color when only one table has it.
+ThemeDiff = namedtuple('ThemeDiff', ['rows_a', 'rows_b', 'kinds', 'before', 'after', 'members'])
+
+
+def first_rows(paths):
+    """The mask of the first row of each path"""
+    mask = np.zeros(len(paths), dtype=bool)
+    mask[np.unique(paths, return_index=True)[1]] = True
+    return mask
+
+
+def diff_tables(paths_a, rgba_a, paths_b, rgba_b, tolerance=0.0):
+    """Compare two color tables by path, colors with every channel within tolerance are equal.
+    Only the first row of a path repeated in a table is compared, the other ones are ignored"""
+    paths_a = np.asarray(paths_a, dtype=str)
+    paths_b = np.asarray(paths_b, dtype=str)
+    common, common_a, common_b = np.intersect1d(paths_a, paths_b, return_indices=True)
+    changed = np.any(np.abs(rgba_a[common_a] - rgba_b[common_b]) > tolerance, axis=1)
+    removed = first_rows(paths_a) & ~np.isin(paths_a, common)
+    added = first_rows(paths_b) & ~np.isin(paths_b, common)
+
+    removed = np.flatnonzero(removed)
+    added = np.flatnonzero(added)
+    rows_a = np.concatenate([common_a[changed], np.full(len(added), -1), removed])
+    rows_b = np.concatenate([common_b[changed], added, np.full(len(removed), -1)])
+    kinds = np.repeat([CHANGED, ADDED, REMOVED],
+                      [np.count_nonzero(changed), len(added), len(removed)])
+
+    if len(kinds) == 0:
+        empty = np.empty((0, 4), dtype=np.float32)
+        return ThemeDiff(rows_a, rows_b, kinds, empty, empty, [])
+
+    keys = np.empty((len(kinds), 9), dtype=np.float32)
+    keys[:, 0] = kinds
+    in_a = rows_a >= 0
+    in_b = rows_b >= 0
+    keys[in_a, 1:5] = rgba_a[rows_a[in_a]]
+    keys[~in_a, 1:5] = rgba_b[rows_b[~in_a]]
+    keys[in_b, 5:9] = rgba_b[rows_b[in_b]]
+    keys[~in_b, 5:9] = rgba_a[rows_a[~in_b]]
+    group_keys, inverse, counts = np.unique(
+        keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    order = np.lexsort((-counts, group_keys[:, 0]))
+    positions = np.empty(len(order), dtype=int)
+    positions[order] = np.arange(len(order))
+    labels = positions[inverse]
+    members = np.split(np.argsort(labels, kind='stable'), np.cumsum(counts[order])[:-1])
+
+    group_keys = group_keys[order]
+    return ThemeDiff(rows_a, rows_b, group_keys[:, 0].astype(int),
+                     group_keys[:, 1:5], group_keys[:, 5:9], members)